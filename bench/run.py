@@ -0,0 +1,254 @@
+"""Checker benchmark: synthetic checks.yaml files with N checks against a local
+MockApp in scale mode (one check per /svc/{id}/health service).
+
+    python -m bench.run                          # 100, 1k and 10k checks
+    python -m bench.run --sizes 100 1000 --storage sqlite --out bench-results.json
+
+Every size and every write benchmark runs in its own subprocess and work dir,
+so module-level config (STATE_PATH, DB_URL, ...) and threads don't leak
+between runs. The summary is written as JSON to --out.
+"""
+import argparse, datetime, json, os, platform, random, shutil, socket, subprocess, sys, tempfile, time
+import urllib.request
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def pct(vals, q):
+    if not vals:
+        return None
+    vals = sorted(vals)
+    return round(vals[min(len(vals) - 1, int(q * len(vals)))], 3)
+
+def summary(vals):
+    return {"p50": pct(vals, 0.50), "p99": pct(vals, 0.99), "max": pct(vals, 1.0), "n": len(vals)}
+
+def generate_checks(n, interval_s, storage, max_in_flight, per_host):
+    # one check per MockApp scale-mode service (mockapp/scale.py)
+    checks = []
+    for i in range(n):
+        checks.append({"name": f"synthetic-{i:05d}", "type": "http", "severity": "P3",
+                       "url": f"{{MOCKAPP_BASE}}/svc/{i}/health", "expect_status": 200, "notify_on": []})
+    return {"global": {"interval_s": interval_s, "jitter_s": 0, "retries": 0, "storage": storage,
+                       "http": {"pool_size": per_host, "keep_alive": True},
+                       "concurrency": {"max_in_flight": max_in_flight, "per_host": per_host}},
+            "checks": checks}
+
+# ---------------------------------------------------------------- MockApp
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_mockapp(workdir, services, workers=2):
+    port = free_port()
+    env = {**os.environ, "PYTHONPATH": ROOT, "MOCK_SERVICES": str(services),
+           "MOCK_FAULTS_PATH": os.path.join(workdir, "mock_faults.json")}
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "mockapp.app:app", "--port", str(port),
+                             "--workers", str(workers), "--log-level", "warning"],
+                            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(base + "/admin/svc", timeout=1):
+                return proc, base
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("MockApp did not start")
+
+# ---------------------------------------------------------------- child: scale run
+
+def scale_run(args):
+    # cwd holds the generated checks.yaml; importing checker.main loads it and
+    # initialises the chosen store, exactly as the real checker does
+    from checker import main, http_pool
+    from checker.checks import EXECUTORS
+    from checker.engine import CheckEngine
+    from checker.plans import compile_checks
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    timing = {}   # name -> [executor start, executor end]
+    overhead, start_lag = [], []
+    first_run, due, running = {}, {}, set()
+
+    def timed(fn):
+        def run(plan, state):
+            t = timing[plan.name] = [time.time(), None]
+            if plan.name in due:
+                start_lag.append((t[0] - due.pop(plan.name)) * 1000)
+            try:
+                return fn(plan, state)
+            finally:
+                t[1] = time.time()
+        return run
+
+    def finish(plan, result, error, retries_used=0):
+        t0, t1 = timing[plan.name]
+        # engine hand-off after the probe, plus executor time not spent on the wire
+        wire = (result[1] + (result[2].get("connect_ms") or 0)) / 1000 if error is None else (t1 - t0)
+        overhead.append(((time.time() - t1) + max(0.0, (t1 - t0) - wire)) * 1000)
+        running.discard(plan.name)
+        main.finish_check(plan, result, error, retries_used)
+
+    plans = compile_checks(main.CFG, {k: timed(v) for k, v in EXECUTORS.items()}, main.ACTIONS)
+    conc = main.CONCURRENCY
+    engine = CheckEngine(lambda name: main.STATE_CACHE.setdefault(name, {}), finish,
+                         max_in_flight=conc.get("max_in_flight", 32), per_host=conc.get("per_host", 8))
+
+    # 1) back-to-back cycles: every check at once, as fast as the engine goes
+    cycles = [engine.run_all(plans) for _ in range(args.cycles)]
+    errors = sum(1 for r in main.store.query_results(since=time.time() - 3600) if r["status"] != "OK")
+    out = {"checks": len(plans), "cycle_s": summary(cycles),
+           "checks_per_s": round(len(plans) * len(cycles) / sum(cycles), 1),
+           "probe_overhead_ms": summary(overhead), "non_ok_results": errors}
+
+    # 2) scheduled like the checker: one interval job per check, spread over the first interval
+    overhead.clear()
+    sched_lag, skipped = [], [0]
+    def fire(plan):
+        now = time.time()
+        first = first_run[plan.name]
+        at = first + max(0, round((now - first) / plan.interval_s)) * plan.interval_s
+        sched_lag.append((now - at) * 1000)
+        if plan.name in running:
+            skipped[0] += 1   # overrun: the engine drops this run too ("skip" policy)
+        else:
+            running.add(plan.name)
+            due[plan.name] = at
+        engine.submit(plan)
+    sched = BackgroundScheduler()
+    now = time.time()
+    for plan in plans:
+        first_run[plan.name] = now + 1 + random.uniform(0, plan.interval_s)
+        sched.add_job(fire, IntervalTrigger(seconds=plan.interval_s), args=[plan], coalesce=True,
+                      next_run_time=datetime.datetime.fromtimestamp(first_run[plan.name]))
+    sched.start()
+    time.sleep(args.duration)
+    sched.shutdown(wait=False)
+    time.sleep(1)
+    out.update({"scheduled_s": args.duration, "interval_s": plans[0].interval_s if plans else None,
+                "scheduled_runs": len(sched_lag), "skipped_runs": skipped[0],
+                "scheduler_lag_ms": summary(sched_lag),
+                "start_lag_ms": summary(start_lag), "scheduled_overhead_ms": summary(overhead)})
+    engine.shutdown()
+    http_pool.close_all()
+    main.store.close()
+    print(json.dumps(out))
+
+# ---------------------------------------------------------------- child: store write throughput
+
+def writes_run(args):
+    if args.backend == "sqlite":
+        from checker import state as backend
+    else:
+        from checker import state_file as backend
+    backend.init_store()
+    names = [f"synthetic-{i:05d}" for i in range(args.checks)]
+    per_call = []
+    t0 = time.perf_counter()
+    for i in range(args.writes):
+        name = names[i % len(names)]
+        status = "FAIL" if i % 50 == 0 else "OK"
+        c0 = time.perf_counter()
+        backend.record_result(name, status, 12, {"status_code": 200, "connect_ms": 0.0})
+        backend.transition(name, status, fail=(status == "FAIL"))
+        per_call.append((time.perf_counter() - c0) * 1000)
+    t_calls = time.perf_counter() - t0
+    backend.flush()
+    t_total = time.perf_counter() - t0
+    print(json.dumps({"backend": args.backend, "writes": args.writes, "checks": args.checks,
+                      "writes_per_s": round(args.writes / t_total, 1),
+                      "call_ms": summary(per_call), "calls_s": round(t_calls, 3),
+                      "final_flush_s": round(t_total - t_calls, 3)}))
+
+# ---------------------------------------------------------------- driver
+
+def child(mode, workdir, env, *argv):
+    cmd = [sys.executable, "-m", "bench.run", mode, *map(str, argv)]
+    p = subprocess.run(cmd, cwd=workdir, env={**os.environ, **env, "PYTHONPATH": ROOT},
+                       capture_output=True, text=True)
+    if p.returncode != 0:
+        raise RuntimeError(f"{mode} {argv} failed:\n{p.stderr[-2000:]}")
+    return json.loads(p.stdout.strip().splitlines()[-1])
+
+def git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    ap.add_argument("--interval", type=float, default=10, help="interval_s of the generated checks")
+    ap.add_argument("--duration", type=float, default=30, help="seconds of scheduled running per size")
+    ap.add_argument("--cycles", type=int, default=3, help="back-to-back cycles per size")
+    ap.add_argument("--storage", choices=["file", "sqlite"], default="file")
+    ap.add_argument("--max-in-flight", type=int, default=32)
+    ap.add_argument("--per-host", type=int, default=8)
+    ap.add_argument("--writes", type=int, default=50000, help="writes per store write benchmark")
+    ap.add_argument("--mock-workers", type=int, default=2, help="uvicorn workers for the MockApp")
+    ap.add_argument("--base", help="use an already running MockApp (MOCK_SERVICES >= largest size)")
+    ap.add_argument("--keep", action="store_true", help="keep the work dir (generated checks.yaml, results)")
+    ap.add_argument("--out", default="bench-results.json")
+    args = ap.parse_args(argv)
+
+    workroot = tempfile.mkdtemp(prefix="checker-bench-")
+    proc, base = ((None, args.base) if args.base else
+                  start_mockapp(workroot, max(args.sizes), args.mock_workers))
+    report = {"started_at": datetime.datetime.now().isoformat(timespec="seconds"), "git_rev": git_rev(),
+              "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+              "params": {k: v for k, v in vars(args).items() if k not in ("out", "keep")},
+              "scale": [], "writes": []}
+    try:
+        for n in args.sizes:
+            wd = os.path.join(workroot, f"n{n}")
+            os.makedirs(wd)
+            cfg = generate_checks(n, args.interval, args.storage, args.max_in_flight, args.per_host)
+            with open(os.path.join(wd, "checks.yaml"), "w") as f:
+                yaml.safe_dump(cfg, f, sort_keys=False)
+            print(f"[bench] {n} checks ...", flush=True)
+            r = child("_scale", wd, {"MOCKAPP_BASE": base, "NOTIFY_DIGEST_S": "1"},
+                      "--cycles", args.cycles, "--duration", args.duration)
+            print(f"[bench] {n} checks: {r['checks_per_s']} checks/s, cycle p50 {r['cycle_s']['p50']}s, "
+                  f"scheduler lag p99 {r['scheduler_lag_ms']['p99']}ms, "
+                  f"probe overhead p99 {r['probe_overhead_ms']['p99']}ms", flush=True)
+            report["scale"].append(r)
+        for backend in ("file", "sqlite"):
+            wd = os.path.join(workroot, f"writes-{backend}")
+            os.makedirs(wd)
+            r = child("_writes", wd, {}, "--backend", backend, "--writes", args.writes,
+                      "--checks", max(args.sizes))
+            print(f"[bench] {backend} store: {r['writes_per_s']} writes/s "
+                  f"(call p99 {r['call_ms']['p99']}ms)", flush=True)
+            report["writes"].append(r)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(10)
+        if not args.keep:
+            shutil.rmtree(workroot, ignore_errors=True)
+    report["finished_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[bench] wrote {args.out}" + (f" (work dir {workroot})" if args.keep else ""))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "_scale":
+        ap = argparse.ArgumentParser()
+        ap.add_argument("--cycles", type=int, default=3)
+        ap.add_argument("--duration", type=float, default=30)
+        scale_run(ap.parse_args(sys.argv[2:]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "_writes":
+        ap = argparse.ArgumentParser()
+        ap.add_argument("--backend", choices=["file", "sqlite"])
+        ap.add_argument("--writes", type=int, default=50000)
+        ap.add_argument("--checks", type=int, default=1000)
+        writes_run(ap.parse_args(sys.argv[2:]))
+    else:
+        main()
@@ -0,0 +1,111 @@
+import inspect, json, threading, time, traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from . import metrics
+from .store import record_result
+
+# Runs on_fail actions on their own small thread pool, so a slow or hung
+# remediation endpoint never holds up probing. Each action has a timeout, a
+# cooldown and an hourly cap per check, at most `per_target` runs against one
+# url at a time, and an identical action (same type, url and payload) that is
+# already queued or running is not queued again. Outcomes are still recorded
+# as ACTION / ACTION_FAIL results of the check that asked for them.
+
+DEFAULTS = {"timeout_s": 10.0, "cooldown_s": 300.0, "max_per_hour": 6}
+DEADLINE_GRACE_S = 1.0   # lets an action's own timeout fire before the pool's
+
+def _takes_timeout(fn):
+    # actions are called as fn(url, payload); only those that accept it get `timeout`
+    try:
+        params = inspect.signature(fn).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(p.name == "timeout" or p.kind is p.VAR_KEYWORD for p in params)
+
+def _call(fn, args, kwargs, deadline):
+    # The action runs on its own daemon thread, so one that ignores its timeout
+    # (a custom action without a timeout parameter, a hung socket) is abandoned
+    # at the deadline instead of holding a pool worker forever.
+    out = {}
+    def target():
+        try:
+            out["res"] = fn(*args, **kwargs)
+        except Exception:
+            out["err"] = traceback.format_exc()[:500]
+    t = threading.Thread(target=target, name="action-call", daemon=True)
+    t.start()
+    t.join(deadline)
+    if t.is_alive():
+        return "timeout", f"timed out after {deadline:g}s"
+    if "err" in out:
+        return "fail", out["err"]
+    return "ok", out.get("res")
+
+class ActionPool:
+    def __init__(self, actions, workers=4, per_target=1, defaults=None):
+        self.actions = actions
+        self.defaults = {**DEFAULTS, **(defaults or {})}
+        self.per_target = per_target
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="action")
+        self._lock = threading.Lock()
+        self._pending = set()   # dedup keys queued or running
+        self._runs = {}         # (check, type, url) -> deque of start times in the last hour
+        self._targets = {}      # url -> Semaphore(per_target)
+
+    def opt(self, action, key):
+        return float(action.get(key, self.defaults[key]))
+
+    def submit(self, name, action, now=None):
+        """Queue `action` for check `name`; returns why it was skipped, or None."""
+        now = now or time.time()
+        url = action["url"]
+        dedup = (action["type"], url, json.dumps(action.get("payload"), sort_keys=True, default=str))
+        limit_key = (name, action["type"], url)
+        with self._lock:
+            runs = self._runs.setdefault(limit_key, deque())
+            while runs and now - runs[0] > 3600:
+                runs.popleft()
+            if dedup in self._pending:
+                reason = "duplicate"
+            elif runs and now - runs[-1] < self.opt(action, "cooldown_s"):
+                reason = "cooldown"
+            elif len(runs) >= self.opt(action, "max_per_hour"):
+                reason = "rate_limit"
+            else:
+                reason = None
+                runs.append(now)
+                self._pending.add(dedup)
+                sem = self._targets.setdefault(url, threading.BoundedSemaphore(self.per_target))
+        if reason:
+            metrics.ACTIONS.inc(reason)
+            return reason
+        self._pool.submit(self._run, name, action, dedup, sem)
+        return None
+
+    def _run(self, name, action, dedup, sem):
+        act = action["type"]
+        try:
+            with sem, metrics.timed("action_run"):
+                t0 = time.perf_counter()
+                fn = self.actions[act]
+                timeout = self.opt(action, "timeout_s")
+                kwargs = {"timeout": timeout} if _takes_timeout(fn) else {}
+                deadline = (timeout + DEADLINE_GRACE_S if kwargs else timeout) or None
+                outcome, res = _call(fn, (action["url"], action.get("payload")), kwargs, deadline)
+                ms = int((time.perf_counter() - t0) * 1000)
+            metrics.ACTIONS.inc(outcome)
+            if outcome == "ok":
+                record_result(name, "ACTION", ms, {"action": act, "result": res})
+            else:
+                if outcome == "timeout":
+                    print(f"Action {act} for {name} still running after {deadline:g}s; abandoned")
+                record_result(name, "ACTION_FAIL", ms, {"action": act, "error": res})
+        finally:
+            with self._lock:
+                self._pending.discard(dedup)
+
+    def pending(self):
+        return len(self._pending)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
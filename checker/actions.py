@@ -1,9 +1,10 @@
-import requests, json
-from .checks import expand_env
+import json
+from . import http_pool
+from .plans import resolve_env as expand_env
 
-def http_post(url, payload=None):
+def http_post(url, payload=None, timeout=10):
     url = expand_env(url)
-    r = requests.post(url, json=payload or {})
+    r = http_pool.post(url, json=payload or {}, timeout=timeout)
     return {"status_code": r.status_code, "text": (r.text[:200] if r.text else "")}
 
 ACTIONS = {
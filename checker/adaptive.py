@@ -0,0 +1,116 @@
+import threading
+
+# Adaptive check intervals: a healthy check relaxes from its interval_s (never
+# below it) up to max_relax times that, within the max for its severity; a
+# failing one tightens toward the min (halving per consecutive failure) until
+# it recovers. A global probe-rate cap stretches the intervals of healthy
+# checks only, so failing checks keep their pace, and never past their max.
+
+DEFAULT_BOUNDS = {"P1": (5.0, 60.0), "P2": (10.0, 120.0), "P3": (15.0, 300.0)}
+RESCHEDULE_DELTA = 0.1   # ignore changes under 10%
+
+class Adaptive:
+    def __init__(self, cfg=None):
+        cfg = cfg or {}
+        self.relax = float(cfg.get("relax_factor", 1.25))
+        self.max_relax = float(cfg.get("max_relax", 2.0))   # healthy cap, as a multiple of interval_s
+        self.max_rate = float(cfg.get("max_probe_rate", 0))   # probes/s over all workers, 0 = no cap
+        self.bounds = dict(DEFAULT_BOUNDS)
+        for sev, b in (cfg.get("severity") or {}).items():
+            lo, hi = self.bounds.get(sev, (5.0, 300.0))
+            self.bounds[sev] = (float(b.get("min_s", lo)), float(b.get("max_s", hi)))
+        self.scale = 1.0          # applied to healthy checks by the rate cap
+        self._cur = {}            # name -> interval before the cap
+        self._healthy = {}        # name -> bool
+        self._applied = {}        # name -> interval last given to the scheduler
+        self._hi = {}             # name -> max interval the cap may stretch to
+        self._short = False       # cap not reachable within the max intervals
+        self._lock = threading.Lock()
+
+    def applies(self, plan):
+        return not plan.cron and plan.type != "job" and plan.get("adaptive", True) is not False
+
+    def limits(self, plan):
+        lo, hi = self.bounds.get(plan.severity, (5.0, 300.0))
+        return float(plan.get("min_interval_s", lo)), float(plan.get("max_interval_s", hi))
+
+    def update(self, plan, status, consecutive_failures=0):
+        """New interval for the scheduler after a result, or None when it has not
+        moved by more than RESCHEDULE_DELTA."""
+        lo, hi = self.limits(plan)
+        base = plan.interval_s
+        name = plan.name
+        with self._lock:
+            cur = self._cur.get(name, base)
+            if status == "FAIL":
+                cur = max(min(lo, base), min(base, hi) / 2 ** max(consecutive_failures, 1))
+            elif status in ("WARN", "CRIT"):
+                cur = min(cur, base)   # slow but up: hold at the configured pace
+            else:
+                # the configured interval is the floor; relaxing stops at max_relax x it
+                cur = min(max(base, min(hi, base * self.max_relax)), max(cur, base) * self.relax)
+            self._cur[name] = cur
+            self._hi[name] = max(hi, cur)
+            self._healthy[name] = status == "OK"
+            return self._apply(name)
+
+    def _eff(self, name, scale):
+        cur = self._cur[name]
+        if not self._healthy.get(name):
+            return cur
+        return min(cur * scale, self._hi[name])
+
+    def _apply(self, name):
+        eff = self._eff(name, self.scale)
+        prev = self._applied.get(name)
+        if prev is not None and abs(eff - prev) <= prev * RESCHEDULE_DELTA:
+            return None
+        self._applied[name] = eff
+        return eff
+
+    def rescale(self, workers=1):
+        """Recompute the rate-cap stretch; returns {name: interval} to reschedule."""
+        if not self.max_rate:
+            return {}
+        cap = self.max_rate / max(workers, 1)
+        with self._lock:
+            names = [n for n in self._cur if self._healthy.get(n)]
+            failing = sum(1 / v for n, v in self._cur.items() if not self._healthy.get(n))
+            room = max(cap - failing, cap * 0.1)   # healthy checks always keep a sliver
+            hrate = lambda sc: sum(1 / self._eff(n, sc) for n in names)
+            top = max([self._hi[n] / self._cur[n] for n in names] + [1.0])
+            if hrate(top) > room:
+                scale = top   # every healthy check at its max and still over the cap
+                if not self._short:
+                    print(f"Adaptive: probe rate {failing + hrate(top):.2f}/s exceeds the cap of {cap:.2f}/s "
+                          "with every healthy check at its max interval")
+                self._short = True
+            else:
+                lo_s, scale = 1.0, top   # smallest stretch that fits under the cap
+                for _ in range(30):
+                    mid = (lo_s + scale) / 2
+                    if hrate(mid) > room:
+                        lo_s = mid
+                    else:
+                        scale = mid
+                if hrate(1.0) <= room:
+                    scale = 1.0
+                self._short = False
+            if abs(scale - self.scale) <= self.scale * RESCHEDULE_DELTA:
+                return {}
+            self.scale = scale
+            out = {}
+            for name in self._cur:
+                eff = self._apply(name)
+                if eff is not None:
+                    out[name] = eff
+            return out
+
+    def rate(self):
+        with self._lock:
+            return sum(1 / self._eff(n, self.scale) for n in self._cur)
+
+    def forget(self, name):
+        with self._lock:
+            for d in (self._cur, self._healthy, self._applied, self._hi):
+                d.pop(name, None)
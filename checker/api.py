@@ -0,0 +1,143 @@
+import json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from . import store
+from .feed import FEED
+from .recent import CODES, STATUSES
+from .rollups import RESOLUTIONS
+
+# Read-only HTTP API over the checker's state and results, so dashboards and
+# other consumers don't need the checker's filesystem:
+#   GET /api/state                       current state of every check, plus the feed cursor
+#   GET /api/results?cursor=N&wait=25    results after seq N (long-poll with wait)
+#   GET /api/results/stream?cursor=N     the same as server-sent events
+#   GET /api/history?name=&since=&until=&res=raw|1m|1h|1d
+#   GET /api/recent?name=&last=100       newest results from memory, as columns (sparklines)
+# Cursors are per checker process; a response with a different `boot` than the
+# client's means the checker restarted and the client should start over.
+
+MAX_LIMIT = 5000
+MAX_WAIT_S = 60
+KEEPALIVE_S = 15
+
+class _Handler(BaseHTTPRequestHandler):
+    def _json(self, obj, status=200):
+        data = json.dumps(obj, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        route = ROUTES.get(url.path.rstrip("/"))
+        if route is None:
+            self._json({"error": f"no route {url.path}"}, 404)
+            return
+        try:
+            route(self, q)
+        except KeyError as e:
+            self._json({"error": f"missing parameter {e}"}, 400)
+        except ValueError as e:
+            self._json({"error": str(e)}, 400)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+def _cursor(q):
+    # A cursor from an earlier checker process restarts from the oldest buffered result
+    if q.get("boot") not in (None, FEED.boot):
+        return 0, True
+    return int(q["cursor"]), False
+
+def get_state(h, q):
+    # cursor taken before the snapshot: following on from it may repeat a result, never skip one
+    seq = FEED.seq
+    h._json({"boot": FEED.boot, "cursor": seq, "states": store.read_states()})
+
+def get_results(h, q):
+    limit = min(int(q.get("limit", 1000)), MAX_LIMIT)
+    name = q.get("name")
+    if "cursor" not in q:
+        recs = FEED.tail(limit, name)
+        h._json({"boot": FEED.boot, "cursor": recs[-1]["seq"] if recs else FEED.seq,
+                 "complete": True, "results": recs})
+        return
+    cursor, reset = _cursor(q)
+    deadline = time.monotonic() + min(float(q.get("wait", 0)), MAX_WAIT_S)
+    recs, cursor, complete = FEED.since(cursor, limit, name)
+    while not recs and not _stopping.is_set():
+        left = deadline - time.monotonic()
+        if left <= 0 or not FEED.wait(cursor, left):
+            break
+        recs, cursor, _ = FEED.since(cursor, limit, name)
+    h._json({"boot": FEED.boot, "cursor": cursor, "complete": complete and not reset, "reset": reset,
+             "results": recs})
+
+def get_stream(h, q):
+    name = q.get("name")
+    # EventSource reconnects with the id of the last event it got
+    last_id = h.headers.get("Last-Event-ID")
+    if last_id and ":" in last_id:
+        q = {**q, "boot": last_id.split(":")[0], "cursor": last_id.split(":")[1]}
+    cursor = _cursor(q)[0] if "cursor" in q else FEED.seq
+    h.send_response(200)
+    h.send_header("Content-Type", "text/event-stream")
+    h.send_header("Cache-Control", "no-cache")
+    h.end_headers()
+    h.wfile.write(f"event: hello\ndata: {json.dumps({'boot': FEED.boot, 'cursor': cursor})}\n\n".encode())
+    h.wfile.flush()
+    while not _stopping.is_set():
+        if not FEED.wait(cursor, KEEPALIVE_S):
+            h.wfile.write(b": keepalive\n\n")
+            h.wfile.flush()
+            continue
+        recs, cursor, _ = FEED.since(cursor, MAX_LIMIT, name)
+        if recs:
+            h.wfile.write("".join(f"id: {FEED.boot}:{r['seq']}\nevent: result\ndata: {json.dumps(r, default=str)}\n\n"
+                                  for r in recs).encode())
+            h.wfile.flush()
+
+def get_history(h, q):
+    now = time.time()
+    since = float(q.get("since", now - 3600))
+    until = float(q.get("until", now))
+    res = q.get("res", "raw")
+    if res == "raw":
+        rows = store.query_results(q.get("name"), since, until)
+    elif res in RESOLUTIONS:
+        rows = store.query_rollups(res, q.get("name"), since, until)
+    else:
+        raise ValueError(f"res {res!r}, expected raw or one of {list(RESOLUTIONS)}")
+    h._json({"name": q.get("name"), "res": res, "since": since, "until": until, "rows": rows})
+
+def get_recent(h, q):
+    since = float(q["since"]) if "since" in q else None
+    last = int(q["last"]) if "last" in q else None
+    ts, codes, latency = store.recent(q["name"], since, last)
+    h._json({"name": q["name"], "ts": ts.tolist(), "status": [STATUSES[c] for c in codes],
+             "latency_ms": latency.tolist(), "failures": codes.count(CODES["FAIL"]),
+             "flaps": sum(1 for a, b in zip(codes, codes[1:]) if a != b)})
+
+ROUTES = {
+    "/api/state": get_state,
+    "/api/results": get_results,
+    "/api/results/stream": get_stream,
+    "/api/history": get_history,
+    "/api/recent": get_recent,
+}
+
+_stopping = threading.Event()
+
+def serve(host="127.0.0.1", port=9180):
+    server = ThreadingHTTPServer((host, int(port)), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="query-api", daemon=True).start()
+    return server
+
+def shutdown():
+    _stopping.set()
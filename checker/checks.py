@@ -1,77 +1,168 @@
-import time, requests, json, os, re, datetime
-from jsonpath_ng import parse as jp_parse
+import time
+from . import coalesce, http_pool, metrics
+from .jobs import FINAL, JobRegistry, deadline_ts
+from .plans import ConfigError, Rule, compile_rules
+from .plans import resolve_env as expand_env   # kept for custom executors
 
-def expand_env(s: str) -> str:
-    if not isinstance(s, str):
-        return s
-    for k,v in os.environ.items():
-        s = s.replace("{"+k+"}", v)
-    return s
+# Executors receive a compiled CheckPlan (checker/plans.py): urls are already
+# resolved and JSONPath rules already parsed.
 
 def jsonpath_asserts(data, rules):
-    for rule in (rules or []):
-        val = [m.value for m in jp_parse(rule["path"]).find(data)]
-        val = val[0] if val else None
-        if "equals" in rule and val != rule["equals"]:
-            return False, f"{rule['path']} != {rule['equals']} (got {val})"
-        if "lt" in rule and not (val is not None and val < rule["lt"]):
-            return False, f"{rule['path']} !< {rule['lt']} (got {val})"
-        if "gt" in rule and not (val is not None and val > rule["gt"]):
-            return False, f"{rule['path']} !> {rule['gt']} (got {val})"
+    # compiled Rules from a plan, or raw expect_jsonpath dicts (custom executors)
+    rules = rules or ()
+    if not all(isinstance(r, Rule) for r in rules):
+        rules, errors = compile_rules(rules)
+        if errors:
+            raise ConfigError("; ".join(errors))
+    for rule in rules:
+        ok, msg = rule.check(data)
+        if not ok:
+            return False, msg
     return True, "ok"
 
-def http_check(cfg, _state=None):   # <- accept the 2nd arg, ignore it
-    url = expand_env(cfg["url"])
-    t0 = time.time()
-    r = requests.get(url, timeout=5)
-    latency_ms = int((time.time()-t0)*1000)
-    if "expect_status" in cfg and r.status_code != cfg["expect_status"]:
-        return False, latency_ms, {"status_code": r.status_code, "body": r.text[:200]}
-    if "expect_jsonpath" in cfg:
-        ok, msg = jsonpath_asserts(r.json(), cfg["expect_jsonpath"])
+def http_check(cfg, state=None):
+    # checks on the same url + headers share one request within coalesce_s (checker/coalesce.py)
+    cap = cfg.max_body_bytes or None
+    def body_bytes(r):
+        # a status mismatch only reports the start of the body; status-only checks read none
+        if cfg.expect_status is not None and r.status_code != cfg.expect_status:
+            return 200
+        return cap if cfg.rules else 0
+    def fetch(fresh_s):
+        return coalesce.fetch(cfg.url, cfg.headers, timeout=5, fresh_s=fresh_s,
+                              max_bytes=cap, body_bytes=body_bytes, conditional=cfg.conditional)
+    f, shared = fetch(cfg.coalesce_s)
+    if (shared and cfg.rules and f.excerpt(cap) and
+            (cfg.expect_status is None or f.status_code == cfg.expect_status)):
+        # the leader only kept an excerpt since the status failed its check, not this one's
+        f, shared = fetch(0)
+    if not shared:
+        metrics.observe_http(f.timing)
+    # latency excludes TCP/TLS setup, which is reported separately as connect_ms
+    latency_ms = int(f.timing["request_ms"])
+    info = {"connect_ms": f.timing["connect_ms"]}
+    if shared:
+        info["shared"] = True
+    if f.not_modified:
+        info["not_modified"] = True
+    if cfg.expect_status is not None and f.status_code != cfg.expect_status:
+        return False, latency_ms, {"status_code": f.status_code, "body": f.text(200), **info}
+    if cfg.rules:
+        if f.truncated:
+            return False, latency_ms, {"error": f"body larger than {cap} bytes", **info}
+        # an unchanged body (304) gets the verdict it got last time
+        asserted = state.get("asserted") if state is not None else None
+        if f.not_modified and asserted and asserted[0] == f.validator and asserted[1] is cfg.rules:
+            ok, msg = asserted[2]
+        else:
+            data = f.json()
+            with metrics.timed("jsonpath"):
+                ok, msg = jsonpath_asserts(data, cfg.rules)
+            if state is not None and f.validator:
+                state["asserted"] = (f.validator, cfg.rules, (ok, msg))
         if not ok:
-            return False, latency_ms, {"error": msg}
-    return True, latency_ms, {"status_code": r.status_code}
-
-def job_check(cfg, state):
-    import time, datetime, os, requests
+            return False, latency_ms, {"error": msg, **info}
+    return True, latency_ms, {"status_code": f.status_code, **info}
 
-    status_url_tpl = expand_env(cfg["status_url"])
+def _registry(state):
+    return state.get("jobs") or state.setdefault("jobs", JobRegistry())
 
-    # Always try to refresh the latest job id from the helper file
-    latest = None
-    try:
-        latest = open(".last_job_id", "r").read().strip()
-    except FileNotFoundError:
-        pass
+def _poll_settings(cfg):
+    p = cfg.get("poll") or {}
+    return (float(p.get("min_s", 2)), float(p.get("max_s", 60)),
+            float(p.get("wait_s", 10)), float(p.get("list_s", 30)))
 
-    if latest and latest != state.get("_last_job_id"):
-        state["_last_job_id"] = latest
-        # (optional) remember when we saw it; useful for relative deadlines
-        state["_job_seen_at"] = time.time()
+def _discover(cfg, reg, now):
+    # list_url returns the app's recent jobs; new ones are tracked, finished ones
+    # settle known jobs without a status poll
+    r = http_pool.get(cfg["list_url"], timeout=5)
+    metrics.observe_http(r.timing)
+    with metrics.timed("json_parse"):
+        listed = r.json().get("jobs", [])
+    for j in listed:
+        status = j.get("status", "running")
+        if reg.add(j["job_id"], j.get("start"), j.get("expected_s"), "running"):
+            job = reg.jobs[j["job_id"]]
+        else:
+            job = reg.jobs.get(j["job_id"])
+            if job is None or job.done or status not in FINAL:
+                continue
+        if status in FINAL:
+            reg.update(job, status, j.get("finished_at") or now)
+    reg.listed_at = now
+    return r.timing["request_ms"]
 
-    job_id = state.get("_last_job_id")
-    if not job_id:
-        return True, 0, {"info": "no job started yet"}
+def job_check(cfg, state):
+    reg = _registry(state)
+    min_s, max_s, wait_s, list_s = _poll_settings(cfg)
+    expected = cfg.get("expected_s")
+    now = time.time()
+    deadline = deadline_ts(cfg.get("success_by"), now)
+    latency_ms = 0
+    if cfg.get("list_url") and now - reg.listed_at >= list_s:
+        latency_ms = _discover(cfg, reg, now)
 
-    url = status_url_tpl.replace("{job_id}", job_id)
-    t0 = time.time()
-    r = requests.get(url, timeout=5)
-    latency_ms = int((time.time() - t0) * 1000)
-    status = r.json().get("status", "unknown")
+    # Only jobs whose next poll is due. The one closest to its expected finish is
+    # long-polled on wait_url (returns as soon as it ends) when that is near.
+    due = reg.due(now)
+    wait_url, waiting = cfg.get("wait_url"), None
+    if wait_url and due:
+        near = min(due, key=lambda j: j.started_at + reg.expected_s(j, expected))
+        if near.started_at + reg.expected_s(near, expected) - now <= wait_s:
+            waiting = near
+            due.remove(near)
+            due.append(near)
+    for job in due:
+        if job is waiting:
+            url = wait_url.replace("{job_id}", job.id)
+            url += ("&" if "?" in url else "?") + f"timeout={wait_s:g}"
+            r = http_pool.get(url, timeout=wait_s + 5)
+        else:
+            r = http_pool.get(cfg.url.replace("{job_id}", job.id), timeout=5)
+            latency_ms = max(latency_ms, r.timing["request_ms"])
+        metrics.observe_http(r.timing)
+        with metrics.timed("json_parse"):
+            status = r.json().get("status", "unknown")
+        reg.update(job, status, time.time(), deadline, min_s, max_s, expected)
 
-    # Absolute deadline (keep if configured)
-    deadline = cfg.get("success_by")  # "HH:MM"
-    if deadline and status != "succeeded":
-        now = datetime.datetime.now().strftime("%H:%M")
-        if now >= deadline:
-            return False, latency_ms, {"status": status, "error": f"missed deadline {deadline}", "job_id": job_id}
+    # Most runs poll no job: unless the verdict changed (a job listed as
+    # finished, a deadline passing) there is nothing to record (finish_check
+    # skips a None result)
+    res = _job_result(cfg, reg, deadline, len(due), latency_ms)
+    seen = (res[0], res[2].get("status"), res[2].get("job_id"), res[2].get("error"))
+    if not due and state.get("reported") == seen:
+        return None
+    state["reported"] = seen
+    return res
 
-    if status == "failed":
-        return False, latency_ms, {"status": status, "job_id": job_id}
+def _job_result(cfg, reg, deadline, polled, latency_ms):
+    now = time.time()
+    last, active = reg.latest_finished(), reg.active()
+    latest = last or (active[-1] if active else None)
+    if latest is None:
+        return True, int(latency_ms), {"info": "no job started yet"}
+    details = {"status": latest.status, "job_id": latest.id, "active": [j.id for j in active][-10:],
+               "polled": polled}
+    if active:
+        details["next_poll_s"] = round(max(0.0, min(j.next_poll for j in active) - now), 1)
 
-    return True, latency_ms, {"status": status, "job_id": job_id}
+    # Absolute deadline: every job still running, or a failed last run, misses it
+    if deadline and now >= deadline:
+        late = [j.id for j in active] + ([last.id] if last and last.status != "succeeded" else [])
+        if late:
+            return False, int(latency_ms), {**details, "error": f"missed deadline {cfg['success_by']}", "late": late}
+    if last and last.status == "failed":
+        return False, int(latency_ms), details
+    return True, int(latency_ms), details
 
+def start_job(cfg, state):
+    r = http_pool.post(cfg["start_url"], timeout=10)
+    r.raise_for_status()
+    body = r.json()
+    job_id = body.get("job_id")
+    if job_id:
+        _registry(state).add(job_id, time.time(), body.get("expected_s"))
+    return job_id
 
 EXECUTORS = {
     "http": http_check,
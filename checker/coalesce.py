@@ -0,0 +1,140 @@
+import json, threading, time
+from . import http_pool, metrics
+
+# Checks that GET the same url with the same headers, body cap and conditional
+# setting share one request: a fetch already in flight is joined, and a
+# finished one is reused while it is younger than the caller's freshness
+# window (coalesce_s). The JSON body is parsed once and shared as well, so
+# executors must treat it as read-only.
+# Failed fetches are not reused once finished (see Fetched.reusable).
+#
+# Bodies are streamed and capped at max_bytes. When the last full response
+# for a url carried an ETag or Last-Modified, the next request is conditional;
+# a 304 answers with the cached status, body and parsed JSON.
+
+class Fetched:
+    __slots__ = ("response", "error", "at", "status_code", "content", "truncated", "validator",
+                 "not_modified", "timing", "_done", "_json", "_parsed", "_lock")
+
+    def __init__(self):
+        self.response = self.error = self._json = self.content = self.validator = None
+        self.at = None   # monotonic time the fetch finished
+        self.status_code, self.truncated, self.not_modified, self.timing = None, False, False, {}
+        self._parsed = False
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def json(self):
+        if not self._parsed:
+            with self._lock:
+                if not self._parsed:
+                    with metrics.timed("json_parse"):
+                        try:
+                            self._json = json.loads(self.content or b"")
+                        except ValueError as e:
+                            self._json = e
+                    self._parsed = True
+        if isinstance(self._json, ValueError):
+            raise self._json
+        return self._json
+
+    def text(self, n=200):
+        return (self.content or b"")[:n].decode("utf-8", "replace")
+
+    def excerpt(self, max_bytes):
+        # cut short by body_bytes rather than by the max_bytes cap
+        return self.truncated and (max_bytes is None or len(self.content or b"") < max_bytes)
+
+    @property
+    def reusable(self):
+        # errors and 5xx are shared only with checks that joined while in flight,
+        # so a retry always goes out again
+        return self.error is None and self.status_code is not None and self.status_code < 500
+
+    def _fill(self, r, prev):
+        self.response, self.timing = r, r.timing
+        if r.status_code == 304 and prev is not None:
+            self.status_code, self.content, self.validator = prev.status_code, prev.content, prev.validator
+            self._json, self._parsed, self.not_modified = prev._json, prev._parsed, True
+            return
+        self.status_code, self.content = r.status_code, r.content
+        self.truncated = getattr(r, "truncated", False)
+        tag, modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+        if (tag or modified) and r.status_code < 300 and not self.truncated:
+            self.validator = (tag, modified)
+
+_lock = threading.Lock()
+_entries = {}     # (url, headers, max_bytes, conditional) -> Fetched
+_validated = {}   # (url, headers, max_bytes, True) -> last full Fetched with an ETag/Last-Modified
+_last_prune = time.monotonic()
+PRUNE_S = 60
+
+def _prune(now):
+    global _last_prune
+    if now - _last_prune < PRUNE_S:
+        return
+    _last_prune = now
+    for key, f in list(_entries.items()):
+        if f.at is not None and now - f.at > PRUNE_S:
+            del _entries[key]
+
+def _get(f, url, headers, timeout, max_bytes, body_bytes, conditional):
+    key = (url, headers, max_bytes, conditional)
+    prev = _validated.get(key) if conditional else None
+    h = dict(headers)
+    if prev is not None:
+        tag, modified = prev.validator
+        if tag:
+            h["If-None-Match"] = tag
+        if modified:
+            h["If-Modified-Since"] = modified
+    r = http_pool.get(url, headers=h or None, timeout=timeout, max_bytes=max_bytes, body_bytes=body_bytes)
+    f._fill(r, prev)
+    if f.not_modified:
+        metrics.NOT_MODIFIED.inc()
+    elif f.validator is not None and conditional:
+        if f.content[:1] in (b"{", b"["):
+            try:
+                f.json()   # parsed once, reused on every 304
+            except ValueError:
+                pass
+        _validated[key] = f
+    elif conditional:
+        _validated.pop(key, None)
+
+def fetch(url, headers=(), timeout=5, fresh_s=0.0, max_bytes=1 << 20, body_bytes=None, conditional=True):
+    """Returns (Fetched, shared); shared is True when another check's request
+    answered this one. Errors are shared the same way and re-raised.
+    body_bytes (see http_pool.request) is applied in full to unshared fetches.
+    A shared fetch must serve every check that joins it, so it only takes the
+    shorter reads (an excerpt when the status already fails) and otherwise
+    keeps up to max_bytes; see Fetched.excerpt."""
+    if fresh_s <= 0:
+        f = Fetched()
+        _get(f, url, headers, timeout, max_bytes, body_bytes, conditional)
+        f.at = time.monotonic()
+        return f, False
+    # checks with a different cap or conditional setting must not answer each other
+    key = (url, headers, max_bytes, conditional)
+    now = time.monotonic()
+    with _lock:
+        _prune(now)
+        f = _entries.get(key)
+        leader = f is None or (f.at is not None and (now - f.at > fresh_s or not f.reusable))
+        if leader:
+            f = _entries[key] = Fetched()
+    if leader:
+        try:
+            shared_bytes = (lambda r: body_bytes(r) or max_bytes) if body_bytes else None
+            _get(f, url, headers, timeout, max_bytes, shared_bytes, conditional)
+        except Exception as e:
+            f.error = e
+        f.at = time.monotonic()
+        f._done.set()
+    else:
+        metrics.COALESCED.inc()
+        if not f._done.wait(timeout + 1):
+            raise TimeoutError(f"shared fetch of {url} did not finish in {timeout}s")
+    if f.error is not None:
+        raise f.error
+    return f, not leader
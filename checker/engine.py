@@ -0,0 +1,151 @@
+import asyncio, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from . import metrics
+
+class RetryBudget:
+    # At most `limit` retries per `window_s` across all checks (None = unlimited).
+    def __init__(self, limit=None, window_s=30):
+        self.limit = None if limit is None else int(limit)
+        self.window_s = float(window_s)
+        self._used = 0
+        self._window_start = time.time()
+
+    def take(self):
+        if self.limit is None:
+            return True
+        now = time.time()
+        if now - self._window_start >= self.window_s:
+            self._window_start, self._used = now, 0
+        if self._used >= self.limit:
+            return False
+        self._used += 1
+        return True
+
+class CheckEngine:
+    """Runs checks concurrently on a private asyncio loop.
+
+    A global semaphore caps checks in flight and a per-host semaphore keeps one
+    slow service from taking every slot. Plain executors and `finish_fn`
+    (state writes, notifications) run on a thread pool sized to the global cap.
+    A probe that raises is retried after an exponential backoff; the wait is a
+    timer on the loop, so it holds no slot and no thread. `finish_fn` runs once
+    per retry chain with the final outcome.
+    Each check's `overrun` policy decides what happens when it is submitted
+    while its previous run is still going: "skip" drops the new run, "queue"
+    runs it once the current one ends, "parallel" starts it anyway.
+    """
+
+    def __init__(self, state_for, finish_fn, max_in_flight=32, per_host=8, retry_budget=None):
+        self.state_for = state_for
+        self.finish_fn = finish_fn
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.per_host = max(1, int(per_host))
+        self.retry_budget = retry_budget or RetryBudget()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="check")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="check-engine", daemon=True)
+        self._thread.start()
+        self._sem = None
+        self._host_sems = {}
+        self._inflight = {}   # check name -> running count (loop thread only)
+        self._pending = {}    # check name -> plan queued behind a running one
+        self.waiting = 0      # runs waiting for a slot (loop thread only; read by /metrics)
+        self.running = 0      # runs holding a slot
+
+    def _host_sem(self, host):
+        if not host:
+            return nullcontext()
+        sem = self._host_sems.get(host)
+        if sem is None:
+            sem = self._host_sems[host] = asyncio.Semaphore(self.per_host)
+        return sem
+
+    @property
+    def queued(self):
+        return len(self._pending)
+
+    def retry_delay(self, plan, attempt):
+        return min(plan.retry_backoff_max_s, plan.retry_backoff_s * (2 ** attempt))
+
+    async def _probe(self, plan):
+        fn = plan.executor
+        state = self.state_for(plan.name)
+        if asyncio.iscoroutinefunction(fn):
+            return await fn(plan, state)
+        return await self._loop.run_in_executor(self._pool, fn, plan, state)
+
+    async def _run(self, plan):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_in_flight)
+        attempt = 0
+        while True:
+            result, error = None, None
+            t_wait = time.perf_counter()
+            self.waiting += 1
+            async with self._sem, self._host_sem(plan.host):
+                self.waiting -= 1
+                self.running += 1
+                metrics.QUEUE_WAIT.observe(time.perf_counter() - t_wait)
+                try:
+                    with metrics.timed("probe"):
+                        result = await self._probe(plan)
+                except Exception as e:
+                    error = e
+                finally:
+                    self.running -= 1
+            if error is None or attempt >= plan.retries or not self.retry_budget.take():
+                break
+            metrics.RETRIES.inc()
+            await asyncio.sleep(self.retry_delay(plan, attempt))
+            attempt += 1
+        await self._loop.run_in_executor(self._pool, self._finish, plan, result, error, attempt)
+
+    def _finish(self, plan, result, error, attempt):
+        with metrics.timed("finish"):
+            self.finish_fn(plan, result, error, attempt)
+
+    async def _run_all(self, plans):
+        return await asyncio.gather(*(self._run(p) for p in plans), return_exceptions=True)
+
+    def run_all(self, plans):
+        # Blocks the caller until the whole batch is done; cycle time is the slowest check.
+        t0 = time.time()
+        results = asyncio.run_coroutine_threadsafe(self._run_all(list(plans)), self._loop).result()
+        for plan, res in zip(plans, results):
+            if isinstance(res, BaseException):
+                print(f"Check {plan.name} crashed: {res!r}")
+        return time.time() - t0
+
+    def submit(self, plan):
+        # Fire-and-forget, safe from any thread (the scheduler calls this per check).
+        self._loop.call_soon_threadsafe(self._start, plan)
+
+    def _start(self, plan):
+        name = plan.name
+        if self._inflight.get(name) and plan.overrun != "parallel":
+            if plan.overrun == "queue":
+                self._pending[name] = plan
+            else:
+                metrics.SKIPPED.inc()
+                print(f"Skipping {name}: previous run still in progress")
+            return
+        self._inflight[name] = self._inflight.get(name, 0) + 1
+        task = self._loop.create_task(self._run(plan))
+        task.add_done_callback(lambda t: self._done(plan, t))
+
+    def _done(self, plan, task):
+        name = plan.name
+        self._inflight[name] -= 1
+        if not self._inflight[name]:
+            del self._inflight[name]
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Check {name} crashed: {task.exception()!r}")
+        queued = self._pending.pop(name, None)
+        if queued is not None:
+            self._start(queued)
+
+    def shutdown(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._pool.shutdown(wait=False)
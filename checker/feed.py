@@ -0,0 +1,48 @@
+import itertools, os, threading, time
+from collections import deque
+
+# The newest results in memory, numbered with a per-process sequence, for the
+# query API (checker/api.py). A reader keeps the last seq it saw as its cursor
+# and only gets what came after it; wait() blocks until something new arrives.
+# `boot` changes on every restart, which tells clients their cursor is stale.
+
+class Feed:
+    def __init__(self, maxlen=10000):
+        self.boot = f"{int(time.time())}-{os.getpid()}"
+        self.seq = 0
+        self._recs = deque(maxlen=maxlen)
+        self._cond = threading.Condition()
+
+    def append(self, name, status, latency_ms, details, ts=None):
+        with self._cond:
+            self.seq += 1
+            self._recs.append({"seq": self.seq, "ts": ts or time.time(), "name": name,
+                               "status": status, "latency_ms": latency_ms, "details": details})
+            self._cond.notify_all()
+
+    def since(self, cursor, limit=1000, name=None):
+        """(records after `cursor`, new cursor, complete). The new cursor is the
+        last seq looked at, so a name filter still moves past other checks.
+        complete is False when records after `cursor` were already dropped."""
+        with self._cond:
+            first = self._recs[0]["seq"] if self._recs else self.seq + 1
+            out, last = [], cursor
+            for r in itertools.islice(self._recs, max(0, cursor + 1 - first), None):
+                if name is None or r["name"] == name:
+                    if len(out) >= limit:
+                        break
+                    out.append(r)
+                last = r["seq"]
+            return out, last, cursor + 1 >= first
+
+    def tail(self, n, name=None):
+        with self._cond:
+            recs = self._recs if name is None else [r for r in self._recs if r["name"] == name]
+            return list(recs)[-n:] if n else []
+
+    def wait(self, cursor, timeout):
+        # True once there is a record past `cursor`
+        with self._cond:
+            return self._cond.wait_for(lambda: self.seq > cursor, timeout)
+
+FEED = Feed(int(os.environ.get("FEED_SIZE", "10000")))
@@ -0,0 +1,149 @@
+import threading, time, requests
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Shared keep-alive sessions, one per scheme://host, used by executors and actions.
+# Each response carries `r.timing` with connection setup (TCP + TLS) split from
+# request time, so probes report the service's latency rather than our handshakes;
+# request time is further split into time to first byte and body read.
+
+POOL_SIZE = 10
+IDLE_TIMEOUT_S = 60.0
+KEEP_ALIVE = True
+DRAIN_BYTES = 64 * 1024
+
+_lock = threading.Lock()
+_sessions = {}   # "scheme://host" -> {"session", "last_used", "in_use"}
+_last_reap = time.monotonic()
+_timing = threading.local()
+
+def configure(pool_size=None, idle_timeout_s=None, keep_alive=None):
+    global POOL_SIZE, IDLE_TIMEOUT_S, KEEP_ALIVE
+    if pool_size is not None:
+        POOL_SIZE = int(pool_size)
+    if idle_timeout_s is not None:
+        IDLE_TIMEOUT_S = float(idle_timeout_s)
+    if keep_alive is not None:
+        KEEP_ALIVE = bool(keep_alive)
+    close_all()
+
+def _add_connect_time(t0):
+    _timing.connect_ms = getattr(_timing, "connect_ms", 0.0) + (time.perf_counter() - t0) * 1000
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        t0 = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _add_connect_time(t0)
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        t0 = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _add_connect_time(t0)
+
+class _TimedHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class _TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPPool, "https": _TimedHTTPSPool}
+
+def _new_session():
+    s = requests.Session()
+    adapter = _TimedAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    if not KEEP_ALIVE:
+        s.headers["Connection"] = "close"
+    return s
+
+def _reap(now):
+    # Close sessions nobody used for IDLE_TIMEOUT_S (caller holds _lock)
+    global _last_reap
+    if now - _last_reap < IDLE_TIMEOUT_S / 2:
+        return
+    _last_reap = now
+    for key, entry in list(_sessions.items()):
+        if not entry["in_use"] and now - entry["last_used"] > IDLE_TIMEOUT_S:
+            entry["session"].close()
+            del _sessions[key]
+
+def _acquire(url):
+    u = urlparse(url)
+    key = f"{u.scheme}://{u.netloc}"
+    now = time.monotonic()
+    with _lock:
+        _reap(now)
+        entry = _sessions.get(key)
+        if entry is None:
+            entry = _sessions[key] = {"session": _new_session(), "last_used": now, "in_use": 0}
+        entry["in_use"] += 1
+        entry["last_used"] = now
+    return entry
+
+def _release(entry):
+    with _lock:
+        entry["in_use"] -= 1
+        entry["last_used"] = time.monotonic()
+
+def _read_capped(r, keep):
+    # Stream at most `keep` bytes of the body into r.content; r.truncated says
+    # there was more. A short remainder is drained so the connection can be
+    # reused; past DRAIN_BYTES the connection is dropped instead.
+    limit = max(keep, DRAIN_BYTES)
+    chunks, n = [], 0
+    for chunk in r.iter_content(64 * 1024):
+        if n < keep:
+            chunks.append(chunk[:keep - n])
+        n += len(chunk)
+        if n > limit:
+            break
+    if n > limit:
+        r.raw.close()
+    r._content, r._content_consumed = b"".join(chunks), True
+    r.truncated = n > keep
+    r.close()   # hands a fully read connection back to the pool
+
+def request(method, url, max_bytes=None, body_bytes=None, **kwargs):
+    """max_bytes: stream the body and keep at most this much (r.truncated).
+    body_bytes(r), if given, sees the status and headers first and returns how
+    much of the body is worth reading (0 when the status alone decides)."""
+    entry = _acquire(url)
+    _timing.connect_ms = 0.0
+    t0 = time.perf_counter()
+    try:
+        r = entry["session"].request(method, url, stream=max_bytes is not None, **kwargs)
+        if max_bytes is not None:
+            _read_capped(r, min(max_bytes, body_bytes(r)) if body_bytes else max_bytes)
+    finally:
+        _release(entry)
+    total_ms = (time.perf_counter() - t0) * 1000
+    connect_ms = _timing.connect_ms
+    # r.elapsed stops once the headers are parsed; the rest is reading the body
+    head_ms = min(total_ms, r.elapsed.total_seconds() * 1000)
+    r.timing = {"connect_ms": round(connect_ms, 1), "request_ms": round(max(0.0, total_ms - connect_ms), 1),
+                "ttfb_ms": round(max(0.0, head_ms - connect_ms), 1), "body_ms": round(total_ms - head_ms, 1)}
+    return r
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+def close_all():
+    with _lock:
+        for entry in _sessions.values():
+            entry["session"].close()
+        _sessions.clear()
@@ -0,0 +1,89 @@
+import datetime, threading, time
+from collections import deque
+
+# Per-check registry of the batch jobs a `type: job` check follows. Jobs come in
+# from start_job() (start_cron) and from the check's list_url, so several can
+# be in flight at once. Each job keeps its own next poll time: far apart while
+# the job has just started, closing in on its expected finish and on the
+# success_by deadline, and backing off again once it runs long.
+
+FINAL = ("succeeded", "failed")
+KEEP_FINISHED = 20
+DEFAULT_EXPECTED_S = 60.0
+
+class Job:
+    __slots__ = ("id", "started_at", "expected_s", "status", "next_poll", "polls", "finished_at")
+
+    def __init__(self, job_id, started_at, expected_s=None, status="running"):
+        self.id, self.started_at, self.expected_s, self.status = job_id, started_at, expected_s, status
+        self.next_poll, self.polls, self.finished_at = 0.0, 0, None
+
+    @property
+    def done(self):
+        return self.status in FINAL
+
+def deadline_ts(hhmm, now):
+    # success_by "HH:MM", local time today
+    if not hhmm:
+        return None
+    h, m = map(int, hhmm.split(":"))
+    return datetime.datetime.fromtimestamp(now).replace(hour=h, minute=m, second=0, microsecond=0).timestamp()
+
+def poll_gap(now, expected_end, deadline, min_s, max_s):
+    """Seconds until the next status poll: half the distance to the expected
+    finish or the deadline, whichever is closer; once past the expected finish,
+    half the time it has overrun by."""
+    gaps = [abs(expected_end - now) / 2]
+    if deadline and deadline > now:
+        gaps.append((deadline - now) / 2)
+    return min(max(min(gaps), min_s), max_s)
+
+class JobRegistry:
+    def __init__(self):
+        self.jobs = {}                       # job id -> Job, in start order
+        self.durations = deque(maxlen=20)    # observed run times of finished jobs
+        self.listed_at = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, job_id, started_at=None, expected_s=None, status="running"):
+        with self._lock:
+            if job_id in self.jobs:
+                return False
+            self.jobs[job_id] = Job(job_id, started_at or time.time(), expected_s, status)
+            return True
+
+    def expected_s(self, job, default=None):
+        if job.expected_s:
+            return job.expected_s
+        if self.durations:
+            return sorted(self.durations)[len(self.durations) // 2]
+        return default or DEFAULT_EXPECTED_S
+
+    def due(self, now):
+        with self._lock:
+            return [j for j in self.jobs.values() if not j.done and j.next_poll <= now]
+
+    def active(self):
+        return [j for j in self.jobs.values() if not j.done]
+
+    def latest_finished(self):
+        done = [j for j in self.jobs.values() if j.done]
+        return max(done, key=lambda j: j.finished_at) if done else None
+
+    def update(self, job, status, now, deadline=None, min_s=2.0, max_s=60.0, default_expected=None):
+        with self._lock:
+            job.polls += 1
+            if status == "unknown":
+                # the app no longer knows it (e.g. restarted); stop following it
+                self.jobs.pop(job.id, None)
+                return
+            job.status = status
+            if job.done:
+                job.finished_at = now
+                self.durations.append(now - job.started_at)
+                finished = [j for j in self.jobs.values() if j.done]
+                for old in finished[:-KEEP_FINISHED]:
+                    del self.jobs[old.id]
+                return
+            end = job.started_at + self.expected_s(job, default_expected)
+            job.next_poll = now + poll_gap(now, end, deadline, min_s, max_s)
@@ -1,95 +1,374 @@
-import os, time, yaml, traceback
+import os, time, yaml, traceback, signal
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.events import EVENT_JOB_SUBMITTED
+from apscheduler.jobstores.base import JobLookupError
 from dotenv import load_dotenv
 
-#from .state import init_db, upsert_state, record_result, read_states
-from .state_file import init_store as init_db
-from .state_file import upsert_state, record_result, read_states
+# before the package imports below: notify.py and state.py read env at import
+load_dotenv()
+
+from . import store
+from .store import transition, record_result
 
-from .checks import EXECUTORS
+from .checks import EXECUTORS, start_job
+from .engine import CheckEngine, RetryBudget
+from .plans import compile_checks, cron_trigger, diff_checks, ConfigError, QUANTILES, PhasedIntervalTrigger, phase_key
+from .sketch import LatencySketch
+from . import http_pool
 from .notify import notify_event
+from . import notify
 from .actions import ACTIONS
+from .action_pool import ActionPool
+from .adaptive import Adaptive
+from . import metrics
+from . import api
+from .shard import Shard, LEASE_DB
 
-load_dotenv()
-init_db()
+# Load config (libyaml's loader when available: ~10x faster on big files)
+CHECKS_PATH = os.getenv("CHECKS_PATH", "checks.yaml")
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+def _config_stamp():
+    st = os.stat(CHECKS_PATH)
+    return st.st_mtime_ns, st.st_size
+
+def load_config():
+    with open(CHECKS_PATH, "r") as f:
+        return yaml.load(f, Loader=_YAML_LOADER) or {}
 
-# Load config
-with open("checks.yaml","r") as f:
-    CFG = yaml.safe_load(f)
+CFG = load_config()
+CFG_STAMP = _config_stamp()
 
 GLOBAL = CFG.get("global", {})
-RETRIES = int(GLOBAL.get("retries", 0))
-BACKOFF = int(GLOBAL.get("retry_backoff_s", 5))
+store.use(GLOBAL.get("storage"))
+store.init_store()
+RETRY_BUDGET = GLOBAL.get("retry_budget")
+CONCURRENCY = GLOBAL.get("concurrency", {})
+INTERVAL = float(GLOBAL.get("interval_s", 30))
+HTTP = GLOBAL.get("http", {})
+METRICS = GLOBAL.get("metrics") or {}
+API = GLOBAL.get("api") or {}
+ACTIONS_CFG = GLOBAL.get("actions") or {}
+ADAPTIVE_CFG = GLOBAL.get("adaptive") or {}
+SHARDING = GLOBAL.get("sharding") or {}
+RELOAD_S = float(GLOBAL.get("reload_s", 2))   # checks.yaml poll interval (0 = no hot reload)
+# Read once at start; changing these in checks.yaml needs a restart
+RESTART_KEYS = ("storage", "http", "concurrency", "retry_budget", "metrics", "api", "actions", "adaptive", "sharding", "reload_s")
+
+http_pool.configure(pool_size=HTTP.get("pool_size"), idle_timeout_s=HTTP.get("idle_timeout_s"),
+                    keep_alive=HTTP.get("keep_alive"))
+
+# Compile once; a bad checks.yaml fails here rather than mid-cycle
+PLANS = compile_checks(CFG, EXECUTORS, ACTIONS)
+
+# Several workers (WORKER_ID set, see checker/workers.py) split the checks by lease
+SHARD = None
+if os.getenv("WORKER_ID"):
+    SHARD = Shard([p.name for p in PLANS], lease_s=SHARDING.get("lease_s", 15),
+                  path=os.getenv("LEASE_DB") or SHARDING.get("db") or LEASE_DB, on_gain=store.refresh)
 
 STATE_CACHE = {}  # per-check runtime memory
+SKETCHES = {}     # name -> LatencySketch (rolling latency quantiles)
+
+def latency_status(plan, latency_ms, details):
+    # OK/WARN/CRIT from the rolling quantile; quantiles go into details
+    sk = SKETCHES.get(plan.name)
+    if sk is None:
+        sk = SKETCHES[plan.name] = LatencySketch(plan.latency_window_s)
+    sk.add(latency_ms)
+    if sk.count() < plan.latency_min_samples:
+        return "OK"
+    q = QUANTILES[plan.latency_q]
+    qs = sk.quantiles(sorted({0.95, 0.99, q}))
+    details["p95_ms"], details["p99_ms"] = qs[0.95], qs[0.99]
+    v = qs[q]
+    if plan.latency_crit_ms is not None and v >= plan.latency_crit_ms:
+        return "CRIT"
+    if plan.latency_warn_ms is not None and v >= plan.latency_warn_ms:
+        return "WARN"
+    return "OK"
 
-def run_check(item):
-    name = item["name"]
-    typ  = item["type"]
-    severity = item.get("severity","P3")
-    notify_on = set(item.get("notify_on", []))
-    on_fail = item.get("on_fail", {})
-    exec_fn = EXECUTORS[typ]
-
-    ok, latency_ms, details = False, 0, {}
-    tries = 0
-    last_err = None
-    while tries <= RETRIES:
-        try:
-            ok, latency_ms, details = exec_fn(item, STATE_CACHE.setdefault(name, {}))
-            break
-        except Exception as e:
-            last_err = str(e)
-            tries += 1
-            time.sleep(BACKOFF)
-    if not ok and last_err:
-        details = {"error": last_err}
+def finish_check(plan, result, error, retries_used=0):
+    # Called once per retry chain with the final outcome
+    if error is None and result is None:
+        return   # the executor had nothing new to report (job_check between polls)
+    name = plan.name
+    if error is not None:
+        # the FAIL recorded below replaces the verdict job_check last reported, so
+        # its next run must record again instead of matching the stale one
+        STATE_CACHE.get(name, {}).pop("reported", None)
+    severity = plan.severity
+    notify_on = plan.notify_on
+
+    if error is None:
+        ok, latency_ms, details = result
+    else:
+        ok, latency_ms, details = False, 0, {"error": str(error)}
+    if retries_used:
+        details = {**details, "retries": retries_used}
 
     status = "OK" if ok else "FAIL"
-    record_result(name, status, latency_ms, details)
-    states = read_states()  # list of dicts: {"name":..., "status":...}
-    prev_states = {r["name"]: r["status"] for r in states}
-    prev = prev_states.get(name, None)
+    if ok and plan.latency_q:
+        details = dict(details)
+        status = latency_status(plan, latency_ms, details)
+    metrics.RESULTS.inc(status)
+    with metrics.timed("state"):
+        record_result(name, status, latency_ms, details)
+        prev = transition(name, status, fail=(status=="FAIL"))
+    if ADAPT is not None and ADAPT.applies(plan):
+        adapt_interval(plan, status)
     fail_transition = (prev != "FAIL" and status == "FAIL")
-    recover_transition = (prev == "FAIL" and status == "OK")
-
-    upsert_state(name, status, fail=(status=="FAIL"))
+    # back up after a FAIL, or out of CRIT when latency_crit was alerted on
+    recover_transition = ((prev == "FAIL" and status != "FAIL") or
+                          (prev == "CRIT" and status in ("OK", "WARN") and "latency_crit" in notify_on))
 
     # Notify?
     if fail_transition and ("first_fail" in notify_on):
         notify_event(name, severity, "first_fail", details)
     if recover_transition and ("recovered" in notify_on):
         notify_event(name, severity, "recovered", details)
+    if status in ("WARN", "CRIT") and prev != status and f"latency_{status.lower()}" in notify_on:
+        notify_event(name, severity, f"latency_{status.lower()}", details)
     # Deadline miss special event for job checks
     if (not ok) and details.get("error","").startswith("missed deadline") and ("deadline_miss" in notify_on):
         notify_event(name, severity, "deadline_miss", details)
 
-    # Auto-actions on fail
-    if (status=="FAIL") and on_fail:
-        for action in on_fail.get("actions", []):
-            act = action["type"]
-            fn = ACTIONS.get(act)
-            if fn:
-                try:
-                    res = fn(action["url"], action.get("payload"))
-                    # also log as a result line
-                    record_result(name, "ACTION", 0, {"action": act, "result": res})
-                except Exception:
-                    record_result(name, "ACTION_FAIL", 0, {"action": act, "error": traceback.format_exc()[:500]})
+    # Auto-actions: queued on the way into FAIL (every failing run with `repeat: true`),
+    # subject to each action's cooldown and hourly cap
+    if status=="FAIL" and plan.actions:
+        with metrics.timed("actions"):
+            for action in plan.actions:
+                if fail_transition or action.get("repeat"):
+                    ACTION_POOL.submit(name, action)
+
+# Health-driven intervals (checker/adaptive.py); SCHED is set by schedule_all
+ADAPT = Adaptive(ADAPTIVE_CFG) if ADAPTIVE_CFG.get("enabled", bool(ADAPTIVE_CFG)) else None
+SCHED = None
+
+def _reschedule(plan, seconds):
+    try:
+        SCHED.reschedule_job(f"check:{plan.name}", trigger=interval_trigger(plan, seconds))
+    except JobLookupError:
+        pass   # removed by a reload meanwhile
+
+def adapt_interval(plan, status):
+    if SCHED is None:
+        return
+    st = store.get_state(plan.name) or {}
+    new = ADAPT.update(plan, status, st.get("consecutive_failures") or 0)
+    if new is not None:
+        _reschedule(plan, new)
+
+def rescale_intervals():
+    # Global probe-rate cap, split over the live workers
+    plans = {p.name: p for p in PLANS}
+    workers = len(SHARD.workers) if SHARD is not None else 1
+    for name, seconds in ADAPT.rescale(workers).items():
+        if name in plans:
+            _reschedule(plans[name], seconds)
+
+ACTION_POOL = ActionPool(ACTIONS, workers=int(ACTIONS_CFG.get("workers", 4)),
+                         per_target=int(ACTIONS_CFG.get("per_target", 1)),
+                         defaults={k: ACTIONS_CFG[k] for k in ("timeout_s", "cooldown_s", "max_per_hour") if k in ACTIONS_CFG})
+
+ENGINE = CheckEngine(lambda name: STATE_CACHE.setdefault(name, {}), finish_check,
+                     max_in_flight=CONCURRENCY.get("max_in_flight", 32),
+                     per_host=CONCURRENCY.get("per_host", 8),
+                     retry_budget=RetryBudget(RETRY_BUDGET, window_s=INTERVAL))
+
+def interval_trigger(plan, seconds):
+    # Phase from the coalesce key: checks on the same resource fire in the same
+    # coalesce_s window every cycle, and distinct ones are spread over the interval
+    return PhasedIntervalTrigger(seconds, phase_key(plan), plan.jitter_s or None)
+
+def check_trigger(plan):
+    if plan.cron:
+        return cron_trigger(plan.cron, plan.jitter_s or None)
+    return interval_trigger(plan, plan.interval_s)
+
+def owns(plan):
+    return SHARD is None or SHARD.owns(plan.name)
+
+def submit_check(plan):
+    if owns(plan):
+        ENGINE.submit(plan)
+
+def run_job_start(plan):
+    if not owns(plan):
+        return
+    name = plan.name
+    try:
+        job_id = start_job(plan, STATE_CACHE.setdefault(name, {}))
+        record_result(name, "JOB_START", 0, {"job_id": job_id})
+    except Exception:
+        record_result(name, "JOB_START_FAIL", 0, {"error": traceback.format_exc()[:500]})
+
+def add_jobs(sched, plan):
+    sched.add_job(submit_check, trigger=check_trigger(plan), args=[plan], id=f"check:{plan.name}",
+                  coalesce=True)
+    if plan.get("start_cron") and plan.get("start_url"):
+        sched.add_job(run_job_start, trigger=cron_trigger(plan["start_cron"]), args=[plan],
+                      id=f"start:{plan.name}", coalesce=True)
+
+def remove_jobs(sched, name):
+    for job_id in (f"check:{name}", f"start:{name}"):
+        if sched.get_job(job_id):
+            sched.remove_job(job_id)
+
+def update_jobs(sched, prev, plan):
+    # Keep the job (and its next run) unless the schedule itself changed
+    name = plan.name
+    if (prev.interval_s, prev.cron, prev.jitter_s) != (plan.interval_s, plan.cron, plan.jitter_s):
+        sched.reschedule_job(f"check:{name}", trigger=check_trigger(plan))
+        if ADAPT is not None:
+            ADAPT.forget(name)
+    sched.modify_job(f"check:{name}", args=[plan])
+    start = (plan.get("start_cron"), plan.get("start_url"))
+    if (prev.get("start_cron"), prev.get("start_url")) != start:
+        if sched.get_job(f"start:{name}"):
+            sched.remove_job(f"start:{name}")
+        if all(start):
+            sched.add_job(run_job_start, trigger=cron_trigger(plan["start_cron"]), args=[plan],
+                          id=f"start:{name}", coalesce=True)
+    elif sched.get_job(f"start:{name}"):
+        sched.modify_job(f"start:{name}", args=[plan])
+    if prev.latency_window_s != plan.latency_window_s:
+        SKETCHES.pop(name, None)
+
+def _accept_global(new_global):
+    # GLOBAL tracks what the next reload is compared with: settings that need a
+    # restart keep showing their new value once warned about, so the warning
+    # is given once per change rather than on every reload
+    global GLOBAL
+    GLOBAL = dict(new_global)
+
+def apply_config(new_cfg, sched):
+    # Compile only added/changed checks and touch only their jobs; unchanged
+    # checks keep their plan, next run time, STATE_CACHE and latency sketch
+    global CFG, PLANS
+    t0 = time.perf_counter()
+    added, removed, changed = diff_checks(CFG, new_cfg)
+    new_global = new_cfg.get("global") or {}
+    stale = [k for k in RESTART_KEYS if new_global.get(k) != GLOBAL.get(k)]
+    if stale:
+        print(f"checks.yaml: {', '.join(stale)} changed; restart the checker to apply")
+    if not (added or removed or changed):
+        CFG = new_cfg
+        _accept_global(new_global)
+        return
+    names = [c.get("name") for c in new_cfg.get("checks") or []]
+    dups = sorted({n for n in names if names.count(n) > 1}) if len(set(names)) != len(names) else []
+    if dups:
+        raise ConfigError(f"duplicate check name(s) {dups}")
+    raws = {c.get("name"): c for c in new_cfg.get("checks") or []}
+    compiled = compile_checks({"global": new_global, "checks": [raws[n] for n in added + changed]},
+                              EXECUTORS, ACTIONS)
+    old = {p.name: p for p in PLANS}
+    for name in removed:
+        remove_jobs(sched, name)
+        STATE_CACHE.pop(name, None)
+        SKETCHES.pop(name, None)
+        store.forget(name)
+        if ADAPT is not None:
+            ADAPT.forget(name)
+    for plan in compiled:
+        if plan.name in old:
+            update_jobs(sched, old[plan.name], plan)
+        else:
+            add_jobs(sched, plan)
+    fresh = {p.name: p for p in compiled}
+    PLANS = [fresh.get(n) or old[n] for n in names]
+    CFG = new_cfg
+    _accept_global(new_global)
+    if SHARD is not None:
+        SHARD.set_names(names)
+        SHARD.tick()   # serialized with the lease thread by Shard's lock
+    print(f"Reloaded {CHECKS_PATH}: +{len(added)} -{len(removed)} ~{len(changed)} checks "
+          f"in {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+def watch_config(sched):
+    global CFG_STAMP
+    try:
+        stamp = _config_stamp()
+    except FileNotFoundError:
+        return
+    if stamp == CFG_STAMP:
+        return
+    CFG_STAMP = stamp
+    try:
+        apply_config(load_config(), sched)
+    except Exception as e:   # half-saved file, ConfigError, ...: keep running the current checks
+        print(f"{CHECKS_PATH} reload failed, keeping the running config:\n{e}")
+
+def start_metrics(sched):
+    port = int(os.getenv("METRICS_PORT", METRICS.get("port", 0)))
+    if not port:
+        return
+    def on_submit(event):
+        for at in event.scheduled_run_times:
+            metrics.SCHEDULER_LAG.observe(max(0.0, time.time() - at.timestamp()))
+    sched.add_listener(on_submit, EVENT_JOB_SUBMITTED)
+    metrics.Gauge("checker_checks", "Configured checks", lambda: len(PLANS))
+    metrics.Gauge("checker_in_flight", "Checks holding a concurrency slot", lambda: ENGINE.running)
+    metrics.Gauge("checker_queue_depth", "Checks waiting for a concurrency slot", lambda: ENGINE.waiting)
+    metrics.Gauge("checker_overrun_queued", "Runs queued behind a still-running one", lambda: ENGINE.queued)
+    metrics.Gauge("checker_notify_queue_depth", "Alerts waiting for the dispatcher", notify.queue_depth)
+    if ADAPT is not None:
+        metrics.Gauge("checker_probe_rate", "Probes per second at the current adaptive intervals", ADAPT.rate)
+    metrics.Gauge("checker_actions_pending", "on_fail actions queued or running", ACTION_POOL.pending)
+    if SHARD is not None:
+        metrics.Gauge("checker_owned_checks", "Checks this worker holds leases for", lambda: len(SHARD.owned))
+        metrics.Gauge("checker_live_workers", "Workers with a live lease", lambda: len(SHARD.workers))
+    host = METRICS.get("host", "127.0.0.1")
+    metrics.serve(host, port, float(os.getenv("PROFILE_HZ", METRICS.get("profile_hz", 0))))
+    print(f"Metrics on http://{host}:{port}/metrics")
+
+def start_api():
+    port = int(os.getenv("API_PORT", API.get("port", 0)))
+    if not port:
+        return
+    host = API.get("host", "127.0.0.1")
+    api.serve(host, port)
+    print(f"Query API on http://{host}:{port}/api/state")
+
+def _sigterm(*_):
+    raise KeyboardInterrupt   # same clean shutdown as Ctrl+C (workers.py stops workers this way)
 
 def schedule_all():
-    sched = BackgroundScheduler()
-    # Every 30s run all checks (simple & effective for demo)
-    sched.add_job(lambda: [run_check(ch) for ch in CFG["checks"]],
-                  trigger=IntervalTrigger(seconds=30), id="batch_checks", max_instances=1)
+    global SCHED
+    sched = SCHED = BackgroundScheduler()
+    start_metrics(sched)
+    start_api()
+    for plan in PLANS:
+        add_jobs(sched, plan)
+    if RELOAD_S > 0:
+        sched.add_job(watch_config, IntervalTrigger(seconds=RELOAD_S), args=[sched], id="config-watch",
+                      coalesce=True, max_instances=1)
+    if ADAPT is not None and ADAPT.max_rate:
+        sched.add_job(rescale_intervals, IntervalTrigger(seconds=10), id="adaptive-rescale",
+                      coalesce=True, max_instances=1)
+    if SHARD is not None:
+        SHARD.start()
+    signal.signal(signal.SIGTERM, _sigterm)
     sched.start()
-    print("Checker running. Press Ctrl+C to stop.")
+    print(f"Checker running {len(PLANS)} checks. Press Ctrl+C to stop.")
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
+        # Ctrl+C reaches workers directly and via workers.py's SIGTERM; stop once
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        if SHARD is not None:
+            SHARD.stop()
         sched.shutdown()
+        ENGINE.shutdown()
+        ACTION_POOL.shutdown()
+        http_pool.close_all()
+        notify.shutdown()
+        api.shutdown()
+        store.close()
 
 if __name__ == "__main__":
     schedule_all()
@@ -0,0 +1,192 @@
+import sys, threading, time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# In-process metrics in the Prometheus text format (no client library):
+# histograms for per-phase timings, counters, and gauges read at scrape time.
+# serve() exposes them on /metrics; an optional sampling profiler adds
+# /debug/profile (folded stacks, ready for flamegraph.pl / speedscope).
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_lock = threading.Lock()
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _num(v):
+    return "+Inf" if v == float("inf") else repr(float(v))
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series = {}   # label values -> [bucket counts..., sum, count]
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        with _lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+                    break
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for labels, s in sorted(series.items()):
+            acc = 0
+            for b, c in zip(self.buckets, s):
+                acc += c
+                le = 'le="%s"' % _num(b)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {s[-2]!r}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {s[-1]}")
+        return out
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *labels, n=1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + n
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            values = dict(self._values) or ({(): 0} if not self.labelnames else {})
+        out += [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in sorted(values.items())]
+        return out
+
+class Gauge:
+    # Either set() it, or pass fn to read the value when scraped
+    def __init__(self, name, help, fn=None):
+        self.name, self.help, self.fn = name, help, fn
+        self.value = 0
+        _registry.append(self)
+
+    def set(self, v):
+        self.value = v
+
+    def render(self):
+        try:
+            v = self.fn() if self.fn else self.value
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {_num(v)}"]
+
+def render():
+    lines = []
+    for m in list(_registry):
+        lines += m.render()
+    return "\n".join(lines) + "\n"
+
+# ---- the checker's metrics ----
+PHASE = Histogram("checker_phase_seconds", "Time spent per check phase", ["phase"])
+SCHEDULER_LAG = Histogram("checker_scheduler_lag_seconds", "Delay between a job's scheduled time and its submission")
+QUEUE_WAIT = Histogram("checker_queue_wait_seconds", "Time a submitted check waited for a concurrency slot")
+RESULTS = Counter("checker_results_total", "Check outcomes by status", ["status"])
+RETRIES = Counter("checker_retries_total", "Probe retries scheduled")
+COALESCED = Counter("checker_coalesced_fetches_total", "Probes answered by another check's request to the same url")
+NOT_MODIFIED = Counter("checker_not_modified_total", "Conditional requests answered 304, reusing the cached body")
+ACTIONS = Counter("checker_actions_total", "on_fail actions by outcome (ok, fail, timeout, duplicate, cooldown, rate_limit)", ["outcome"])
+SKIPPED = Counter("checker_overrun_skips_total", "Runs dropped because the previous run was still going")
+
+def observe(phase, seconds):
+    PHASE.observe(seconds, phase)
+
+@contextmanager
+def timed(phase):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE.observe(time.perf_counter() - t0, phase)
+
+def observe_http(timing):
+    # r.timing from http_pool, in ms
+    for phase in ("connect", "ttfb", "body"):
+        v = timing.get(f"{phase}_ms")
+        if v is not None:
+            PHASE.observe(v / 1000, phase)
+
+# ---- sampling profiler ----
+class SamplingProfiler:
+    """Samples every thread's stack `hz` times a second into folded-stack counts."""
+
+    def __init__(self, hz=50, max_stacks=5000):
+        self.interval = 1.0 / hz
+        self.max_stacks = max_stacks
+        self.samples = 0
+        self._stacks = _Tally()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or names.get(ident) == "metrics-http":
+                    continue
+                stack = []
+                while frame is not None and len(stack) < 40:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]})")
+                    frame = frame.f_back
+                key = ";".join([names.get(ident, str(ident))] + stack[::-1])
+                with self._lock:
+                    if key in self._stacks or len(self._stacks) < self.max_stacks:
+                        self._stacks[key] += 1
+            self.samples += 1
+
+    def folded(self):
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{k} {v}\n" for k, v in stacks)
+
+PROFILER = None
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body, ctype = render(), "text/plain; version=0.0.4"
+        elif self.path.split("?")[0] == "/debug/profile" and PROFILER is not None:
+            body, ctype = PROFILER.folded(), "text/plain"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def serve(host="127.0.0.1", port=9108, profile_hz=0):
+    global PROFILER
+    if profile_hz:
+        PROFILER = SamplingProfiler(profile_hz)
+    server = ThreadingHTTPServer((host, int(port)), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
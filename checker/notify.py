@@ -1,17 +1,62 @@
-import os, smtplib, ssl, traceback
+import os, smtplib, ssl, traceback, threading, queue, time
 from email.mime.text import MIMEText
-#from .state import update_last_notification
-from .state_file import update_last_notification
+from .store import update_last_notification
+from . import metrics
 
 SMTP_HOST = os.getenv("SMTP_HOST")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASS = os.getenv("SMTP_PASS")
+SMTP_TLS  = os.getenv("SMTP_TLS", "1") != "0"     # STARTTLS
+SMTP_AUTH = os.getenv("SMTP_AUTH", "1") != "0"    # 0 for a local SMTP stand-in without login
 MAIL_FROM = os.getenv("MAIL_FROM","monitor@demo.local")
 MAIL_TO   = os.getenv("MAIL_TO","ops@example.com")
 
+# Alerts go onto an in-process queue; one dispatcher thread batches everything
+# that arrives within DIGEST_WINDOW_S into a single email, sends it over one
+# long-lived SMTP session, and retries with backoff. Checks never wait on SMTP.
+DIGEST_WINDOW_S = float(os.getenv("NOTIFY_DIGEST_S", "10"))
+SEND_RETRIES = int(os.getenv("NOTIFY_RETRIES", "5"))
+RETRY_BACKOFF_S = float(os.getenv("NOTIFY_RETRY_BACKOFF_S", "2"))
+
+_queue = queue.Queue()
+_STOP = object()
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+_smtp = None
+
+def _console_only():
+    return not SMTP_HOST or (SMTP_AUTH and (not SMTP_USER or not SMTP_PASS))
+
+def _session():
+    # Reuse the authenticated session while the server still answers NOOP
+    global _smtp
+    if _smtp is not None:
+        try:
+            if _smtp.noop()[0] == 250:
+                return _smtp
+        except OSError:   # includes SMTPException
+            pass
+        _close_session()
+    s = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+    if SMTP_TLS:
+        s.starttls(context=ssl.create_default_context())
+    if SMTP_AUTH:
+        s.login(SMTP_USER, SMTP_PASS)
+    _smtp = s
+    return s
+
+def _close_session():
+    global _smtp
+    if _smtp is not None:
+        try:
+            _smtp.quit()
+        except Exception:
+            pass
+        _smtp = None
+
 def _send(subject, body):
-    if not SMTP_HOST or not SMTP_USER or not SMTP_PASS:
+    if _console_only():
         print("\n=== EMAIL (console fallback) ===")
         print(subject)
         print(body)
@@ -21,17 +66,80 @@ def _send(subject, body):
     msg["Subject"] = subject
     msg["From"] = MAIL_FROM
     msg["To"] = MAIL_TO
-    ctx = ssl.create_default_context()
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
-        s.starttls(context=ctx)
-        s.login(SMTP_USER, SMTP_PASS)
-        s.sendmail(MAIL_FROM, [MAIL_TO], msg.as_string())
+    _session().sendmail(MAIL_FROM, [MAIL_TO], msg.as_string())
+
+def _send_with_retry(subject, body):
+    for attempt in range(SEND_RETRIES + 1):
+        try:
+            _send(subject, body)
+            return True
+        except Exception:
+            _close_session()
+            if attempt == SEND_RETRIES:
+                print("Email send failed:", traceback.format_exc())
+                return False
+            time.sleep(min(60, RETRY_BACKOFF_S * (2 ** attempt)))
+
+def _compose(batch):
+    if len(batch) == 1:
+        e = batch[0]
+        return (f"[{e['severity']}][{e['event'].upper()}] {e['name']}",
+                f"{e['name']} -> {e['event']}\n\nDetails:\n{e['details']}")
+    severities = sorted({e["severity"] for e in batch})
+    subject = f"[{'/'.join(severities)}][DIGEST] {len(batch)} alerts: " + ", ".join(
+        f"{e['name']} {e['event']}" for e in batch[:5]) + (" ..." if len(batch) > 5 else "")
+    parts = [f"{len(batch)} alerts in the last {int(DIGEST_WINDOW_S)}s:\n"]
+    for e in sorted(batch, key=lambda e: (e["severity"], e["ts"])):
+        when = time.strftime("%H:%M:%S", time.localtime(e["ts"]))
+        parts.append(f"[{e['severity']}][{e['event'].upper()}] {e['name']} at {when}\n  {e['details']}")
+    return subject, "\n".join(parts)
+
+def _dispatch_loop():
+    while True:
+        first = _queue.get()
+        if first is _STOP:
+            break
+        batch, stop = [first], False
+        deadline = time.monotonic() + DIGEST_WINDOW_S
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            try:
+                e = _queue.get(timeout=left)
+            except queue.Empty:
+                break
+            if e is _STOP:
+                stop = True
+                break
+            batch.append(e)
+        subject, body = _compose(batch)
+        with metrics.timed("notify_send"):
+            sent = _send_with_retry(subject, body)
+        if sent:
+            for name in {e["name"] for e in batch}:
+                update_last_notification(name)
+        if stop:
+            break
+    _close_session()
+
+def _ensure_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None or not _dispatcher.is_alive():
+            _dispatcher = threading.Thread(target=_dispatch_loop, name="notify-dispatcher", daemon=True)
+            _dispatcher.start()
 
 def notify_event(name, severity, event, details):
-    subject = f"[{severity}][{event.upper()}] {name}"
-    body = f"{name} -> {event}\n\nDetails:\n{details}"
-    try:
-        _send(subject, body)
-        update_last_notification(name)
-    except Exception:
-        print("Email send failed:", traceback.format_exc())
+    with metrics.timed("notify"):
+        _ensure_dispatcher()
+        _queue.put({"name": name, "severity": severity, "event": event, "details": details, "ts": time.time()})
+
+def queue_depth():
+    return _queue.qsize()
+
+def shutdown(timeout=15):
+    # Send what is queued (as one last digest) and stop the dispatcher
+    if _dispatcher is not None and _dispatcher.is_alive():
+        _queue.put(_STOP)
+        _dispatcher.join(timeout)
@@ -0,0 +1,315 @@
+import hashlib, os, re
+from datetime import datetime
+from functools import lru_cache
+from math import ceil, floor
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Callable, Optional, Tuple
+from urllib.parse import urlparse
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from jsonpath_ng import parse as jp_parse
+
+# checks.yaml is compiled once at load into immutable CheckPlan objects: JSONPath
+# parsed, {VAR} templates resolved, operators and executors validated. The hot
+# path only executes plans; a bad config fails here, at startup.
+
+OPERATORS = ("equals", "lt", "gt")
+OVERRUN_POLICIES = ("skip", "queue", "parallel")
+NOTIFY_EVENTS = ("first_fail", "recovered", "deadline_miss", "latency_warn", "latency_crit")
+QUANTILES = {"p50": 0.50, "p90": 0.90, "p95": 0.95, "p99": 0.99}
+_VAR = re.compile(r"\{(\w+)\}")
+# jsonpath_ng parsing costs ms per expression; checks mostly share a few paths
+_parse_path = lru_cache(maxsize=4096)(jp_parse)
+
+class ConfigError(ValueError):
+    pass
+
+def resolve_env(s, env=None):
+    # Unknown names (e.g. {job_id}) are left in place for the executor to fill
+    if not isinstance(s, str):
+        return s
+    env = os.environ if env is None else env
+    return _VAR.sub(lambda m: env.get(m.group(1), m.group(0)), s)
+
+def _freeze(v):
+    if isinstance(v, dict):
+        return MappingProxyType({k: _freeze(x) for k, x in v.items()})
+    if isinstance(v, (list, tuple)):
+        return tuple(_freeze(x) for x in v)
+    return v
+
+@dataclass(frozen=True)
+class Rule:
+    path: str
+    op: str
+    value: Any
+    expr: Any = field(repr=False, compare=False)
+
+    def check(self, data):
+        val = [m.value for m in self.expr.find(data)]
+        val = val[0] if val else None
+        if self.op == "equals" and val != self.value:
+            return False, f"{self.path} != {self.value} (got {val})"
+        if self.op == "lt" and not (val is not None and val < self.value):
+            return False, f"{self.path} !< {self.value} (got {val})"
+        if self.op == "gt" and not (val is not None and val > self.value):
+            return False, f"{self.path} !> {self.value} (got {val})"
+        return True, "ok"
+
+@dataclass(frozen=True, eq=False)
+class CheckPlan(Mapping):
+    name: str
+    type: str
+    severity: str
+    executor: Callable = field(repr=False)
+    url: Optional[str] = None           # resolved url (http) or status_url template (job)
+    host: str = ""
+    expect_status: Optional[int] = None
+    headers: Tuple[Tuple[str, str], ...] = ()   # sorted, so equal headers give equal keys
+    coalesce_s: float = 0.0              # share a fetch of the same url + headers this fresh
+    max_body_bytes: int = 1 << 20        # read at most this much of a body, 0 = no cap
+    conditional: bool = True             # send If-None-Match / If-Modified-Since when possible
+    rules: Tuple[Rule, ...] = ()
+    notify_on: frozenset = frozenset()
+    actions: Tuple[Mapping, ...] = ()
+    interval_s: float = 30.0
+    cron: Optional[str] = None
+    jitter_s: float = 0.0
+    overrun: str = "skip"
+    retries: int = 0
+    retry_backoff_s: float = 5.0
+    retry_backoff_max_s: float = 60.0
+    latency_q: Optional[str] = None      # rolling quantile judged against warn/crit, e.g. "p95"
+    latency_warn_ms: Optional[float] = None
+    latency_crit_ms: Optional[float] = None
+    latency_window_s: float = 300.0
+    latency_min_samples: int = 5
+    cfg: Mapping = field(default_factory=lambda: MappingProxyType({}), repr=False)
+
+    # Read-only mapping over the resolved config, so custom executors keep
+    # working with cfg["key"] / cfg.get("key")
+    def __getitem__(self, key):
+        return self.cfg[key]
+
+    def __iter__(self):
+        return iter(self.cfg)
+
+    def __len__(self):
+        return len(self.cfg)
+
+def compile_rules(rules, where="expect_jsonpath"):
+    out, errors = [], []
+    for i, rule in enumerate(rules or []):
+        at = f"{where}[{i}]"
+        if not isinstance(rule, Mapping) or "path" not in rule:
+            errors.append(f"{at}: needs a 'path'")
+            continue
+        unknown = set(rule) - {"path", *OPERATORS}
+        if unknown:
+            errors.append(f"{at}: unknown operator(s) {sorted(unknown)}, expected one of {list(OPERATORS)}")
+        ops = [op for op in OPERATORS if op in rule]
+        if not ops:
+            errors.append(f"{at}: no operator, expected one of {list(OPERATORS)}")
+        try:
+            expr = _parse_path(rule["path"])
+        except Exception as e:
+            errors.append(f"{at}: bad JSONPath {rule['path']!r}: {e}")
+            continue
+        for op in ops:
+            if op in ("lt", "gt") and (isinstance(rule[op], bool) or not isinstance(rule[op], (int, float))):
+                errors.append(f"{at}: '{op}' needs a number, got {rule[op]!r}")
+                continue
+            out.append(Rule(rule["path"], op, rule[op], expr))
+    return tuple(out), errors
+
+def compile_check(raw, defaults, executors, actions):
+    errors = []
+    name = raw.get("name") if isinstance(raw, Mapping) else None
+    if not name:
+        raise ConfigError(f"check without a name: {raw!r}")
+    typ = raw.get("type")
+    executor = executors.get(typ)
+    if executor is None:
+        errors.append(f"unknown type {typ!r}, expected one of {sorted(executors)}")
+
+    resolved = {k: resolve_env(v) for k, v in raw.items()}
+    url = resolved.get("url") or resolved.get("status_url")
+    if typ == "http" and not resolved.get("url"):
+        errors.append("http check needs a 'url'")
+    if typ == "job" and not resolved.get("status_url"):
+        errors.append("job check needs a 'status_url'")
+    if url and _VAR.sub("", url) == url and not urlparse(url).scheme:
+        errors.append(f"url {url!r} is not absolute")
+    leftover = [v for v in _VAR.findall(url or "") if v != "job_id"]
+    if leftover:
+        errors.append(f"url {url!r} references unset variable(s) {leftover}")
+
+    headers = raw.get("headers") or {}
+    if not isinstance(headers, Mapping):
+        errors.append("headers must be a mapping")
+        headers = {}
+    headers = tuple(sorted((str(k), str(resolve_env(v))) for k, v in headers.items()))
+
+    rules, rule_errors = compile_rules(raw.get("expect_jsonpath"))
+    errors += rule_errors
+
+    notify_on = frozenset(raw.get("notify_on", []))
+    bad = notify_on - set(NOTIFY_EVENTS)
+    if bad:
+        errors.append(f"unknown notify_on event(s) {sorted(bad)}")
+
+    acts = []
+    for i, a in enumerate((raw.get("on_fail") or {}).get("actions", [])):
+        if a.get("type") not in actions:
+            errors.append(f"on_fail.actions[{i}]: unknown action {a.get('type')!r}")
+        elif not a.get("url"):
+            errors.append(f"on_fail.actions[{i}]: needs a 'url'")
+        elif any(not isinstance(a.get(k, 0), (int, float)) or a.get(k, 0) < 0
+                 for k in ("timeout_s", "cooldown_s", "max_per_hour")):
+            errors.append(f"on_fail.actions[{i}]: timeout_s, cooldown_s and max_per_hour must be numbers >= 0")
+        else:
+            acts.append(MappingProxyType({k: resolve_env(v) for k, v in a.items()}))
+
+    cron = raw.get("cron")
+    for key in ("cron", "start_cron"):
+        if raw.get(key):
+            try:
+                cron_trigger(raw[key])
+            except Exception as e:
+                errors.append(f"{key} {raw[key]!r}: {e}")
+    overrun = raw.get("overrun", "skip")
+    if overrun not in OVERRUN_POLICIES:
+        errors.append(f"overrun {overrun!r}, expected one of {list(OVERRUN_POLICIES)}")
+
+    def num(key, default, cast=float):
+        try:
+            v = cast(raw.get(key, defaults.get(key, default)))
+        except (TypeError, ValueError):
+            errors.append(f"{key} must be a number, got {raw.get(key)!r}")
+            return cast(default)
+        if v < 0:
+            errors.append(f"{key} must be >= 0")
+        return v
+
+    lat = _latency_spec(raw, defaults, errors)
+
+    http = defaults.get("http") or {}
+    conditional = raw.get("conditional", http.get("conditional", True))
+    if not isinstance(conditional, bool):
+        errors.append(f"conditional must be true or false, got {conditional!r}")
+
+    interval_s = num("interval_s", 30)
+    if not cron and interval_s <= 0:
+        errors.append("interval_s must be > 0")
+    plan = CheckPlan(
+        name=name, type=typ, severity=raw.get("severity", "P3"), executor=executor,
+        url=url, host=urlparse(url or "").netloc, expect_status=raw.get("expect_status"),
+        headers=headers, coalesce_s=num("coalesce_s", http.get("coalesce_s", 0)),
+        max_body_bytes=num("max_body_bytes", http.get("max_body_bytes", 1 << 20), int),
+        conditional=bool(conditional),
+        rules=rules, notify_on=notify_on, actions=tuple(acts),
+        interval_s=interval_s, cron=cron, jitter_s=num("jitter_s", 2), overrun=overrun,
+        retries=num("retries", 0, int), retry_backoff_s=num("retry_backoff_s", 5),
+        retry_backoff_max_s=num("retry_backoff_max_s", 60), **lat, cfg=_freeze(resolved))
+    if errors:
+        raise ConfigError(f"check {name!r}: " + "; ".join(errors))
+    return plan
+
+def _latency_spec(raw, defaults, errors):
+    # `latency:` on a check, else global.thresholds api_warn_ms/api_crit_ms for http checks;
+    # `latency: false` turns it off
+    spec = raw.get("latency")
+    if spec is False:
+        return {}
+    if spec is None:
+        th = defaults.get("thresholds") or {}
+        if raw.get("type") != "http" or not (th.get("api_warn_ms") or th.get("api_crit_ms")):
+            return {}
+        spec = {"warn_ms": th.get("api_warn_ms"), "crit_ms": th.get("api_crit_ms")}
+    if not isinstance(spec, Mapping):
+        errors.append("latency must be a mapping or false")
+        return {}
+    q = spec.get("quantile", "p95")
+    if q not in QUANTILES:
+        errors.append(f"latency.quantile {q!r}, expected one of {list(QUANTILES)}")
+    warn, crit = spec.get("warn_ms"), spec.get("crit_ms")
+    if warn is None and crit is None:
+        errors.append("latency needs warn_ms and/or crit_ms")
+    if warn is not None and crit is not None and warn > crit:
+        errors.append("latency.warn_ms must be <= crit_ms")
+    return {"latency_q": q, "latency_warn_ms": warn, "latency_crit_ms": crit,
+            "latency_window_s": float(spec.get("window_s", 300)),
+            "latency_min_samples": int(spec.get("min_samples", 5))}
+
+def cron_trigger(expr, jitter=None):
+    fields = expr.split()
+    if len(fields) != 5:
+        raise ValueError(f"expected 5 fields, got {len(fields)}")
+    minute, hour, day, month, day_of_week = fields
+    return CronTrigger(minute=minute, hour=hour, day=day, month=month,
+                       day_of_week=day_of_week, jitter=jitter)
+
+def _unit(*key):
+    # stable value in [0, 1) for a key (unlike hash(), the same in every process)
+    digest = hashlib.blake2b(repr(key).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+class PhasedIntervalTrigger(IntervalTrigger):
+    """Fires at phase + k * interval (+ jitter), with the phase and each run's
+    jitter derived from `key` instead of drawn at random: triggers with the
+    same key and interval fire together every cycle, and jitter does not
+    accumulate from one run to the next like IntervalTrigger's does."""
+
+    def __init__(self, seconds, key, jitter=None):
+        super().__init__(seconds=seconds)
+        self.key = key
+        self.phase = _unit(key) * self.interval_length
+        self.spread = min(float(jitter or 0), self.interval_length / 2)
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        step = self.interval_length
+        if previous_fire_time is not None:
+            k = floor((previous_fire_time.timestamp() - self.phase) / step) + 1
+        else:
+            k = ceil((now.timestamp() - self.phase) / step)
+        ts = self.phase + k * step + _unit(self.key, k) * self.spread
+        return datetime.fromtimestamp(ts, self.timezone)
+
+def phase_key(plan):
+    # checks that can share a fetch (checker/coalesce.py) share a phase
+    if plan.type == "http" and plan.coalesce_s > 0:
+        return ("GET", plan.url, plan.headers)
+    return plan.name
+
+def compile_checks(cfg, executors, actions):
+    defaults = cfg.get("global", {}) or {}
+    plans, errors, seen = [], [], set()
+    for raw in cfg.get("checks") or []:
+        try:
+            plan = compile_check(raw, defaults, executors, actions)
+        except ConfigError as e:
+            errors.append(str(e))
+            continue
+        if plan.name in seen:
+            errors.append(f"duplicate check name {plan.name!r}")
+        seen.add(plan.name)
+        plans.append(plan)
+    if errors:
+        raise ConfigError("invalid checks.yaml:\n  " + "\n  ".join(errors))
+    return plans
+
+def diff_checks(old_cfg, new_cfg):
+    """Names of (added, removed, changed) checks between two parsed checks.yaml
+    files. A changed `global` section marks every kept check as changed, since
+    its defaults feed into each plan."""
+    old = {c.get("name"): c for c in (old_cfg or {}).get("checks") or []}
+    new = {c.get("name"): c for c in (new_cfg or {}).get("checks") or []}
+    added = [n for n in new if n not in old]
+    removed = [n for n in old if n not in new]
+    if (old_cfg or {}).get("global") != (new_cfg or {}).get("global"):
+        changed = [n for n in new if n in old]
+    else:
+        changed = [n for n in new if n in old and old[n] != new[n]]
+    return added, removed, changed
@@ -0,0 +1,159 @@
+import os, struct, sys, threading
+from array import array
+from bisect import bisect_left
+
+# The last N probe results of every check, in memory, for rules and views
+# that need recent history (flapping, "N of the last M failed", sparklines)
+# without reading the results log. Each check has a ring of three parallel
+# arrays: uint32 epoch seconds, uint8 status code and uint16 latency ms, so a
+# result costs 7 bytes (2048 results for 10k checks is about 140 MB) and
+# arrays only grow as far as a check has results. Appends are O(1); time
+# windows are found by bisecting the two sorted runs of the ring.
+
+STATUSES = ("OK", "WARN", "CRIT", "FAIL")
+CODES = {s: i for i, s in enumerate(STATUSES)}
+LATENCY_MAX_MS = 65535
+
+MAGIC = b"RING1"
+_HEAD = struct.Struct("<cHII")   # byte order, name length, size, count
+
+class Ring:
+    __slots__ = ("size", "head", "ts", "status", "latency")
+
+    def __init__(self, size):
+        self.size = size
+        self.head = 0   # oldest entry once the ring is full; 0 while it grows
+        self.ts, self.status, self.latency = array("I"), array("B"), array("H")
+
+    def __len__(self):
+        return len(self.ts)
+
+    def append(self, ts, status, latency_ms):
+        code = CODES[status]
+        lat = min(max(int(latency_ms or 0), 0), LATENCY_MAX_MS)
+        if len(self.ts) < self.size:
+            self.ts.append(int(ts))
+            self.status.append(code)
+            self.latency.append(lat)
+        else:
+            h = self.head
+            self.ts[h], self.status[h], self.latency[h] = int(ts), code, lat
+            self.head = (h + 1) % self.size
+
+    def _start(self, since=None, last=None):
+        # logical index (0 = oldest) of the first entry in the window
+        n, h, ts = len(self.ts), self.head, self.ts
+        start = 0
+        if since is not None:
+            i = bisect_left(ts, since, h, n)
+            start = i - h if i < n else (n - h) + bisect_left(ts, since, 0, h)
+        if last is not None:
+            start = max(start, n - last)
+        return start
+
+    def _slice(self, arr, start):
+        n, h = len(arr), self.head
+        if start < n - h:
+            return arr[h + start:] + arr[:h]
+        return arr[start - (n - h):h]
+
+    def window(self, since=None, last=None):
+        """(ts, status codes, latency ms) arrays, oldest first, for the results
+        at or after `since` and/or the `last` N."""
+        start = self._start(since, last)
+        return self._slice(self.ts, start), self._slice(self.status, start), self._slice(self.latency, start)
+
+    def count(self, status="FAIL", since=None, last=None):
+        return self._slice(self.status, self._start(since, last)).count(CODES[status])
+
+    def flaps(self, since=None, last=None):
+        # status changes within the window
+        s = self._slice(self.status, self._start(since, last))
+        return sum(1 for a, b in zip(s, s[1:]) if a != b)
+
+class Recent:
+    def __init__(self, size=2048):
+        self.size = size
+        self.rings = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, ts, status, latency_ms):
+        if status not in CODES:
+            return   # ACTION, JOB_START, ...
+        ring = self.rings.get(name)
+        if ring is None:
+            ring = self.rings.setdefault(name, Ring(self.size))
+        with self._lock:
+            ring.append(ts, status, latency_ms)
+
+    def window(self, name, since=None, last=None):
+        ring = self.rings.get(name)
+        if ring is None:
+            return array("I"), array("B"), array("H")
+        with self._lock:
+            return ring.window(since, last)
+
+    def count(self, name, status="FAIL", since=None, last=None):
+        ring = self.rings.get(name)
+        with self._lock:
+            return ring.count(status, since, last) if ring else 0
+
+    def flaps(self, name, since=None, last=None):
+        ring = self.rings.get(name)
+        with self._lock:
+            return ring.flaps(since, last) if ring else 0
+
+    def drop(self, name):
+        self.rings.pop(name, None)
+
+    def nbytes(self):
+        return sum(len(r) * 7 for r in self.rings.values())
+
+    def save(self, path):
+        # name + arrays in logical order for every ring; atomic replace
+        tmp = f"{path}.{os.getpid()}.tmp"
+        order = b"<" if sys.byteorder == "little" else b">"
+        with self._lock:
+            items = [(name, r.window()) for name, r in list(self.rings.items())]
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            for name, (ts, status, latency) in items:
+                raw = name.encode()
+                f.write(_HEAD.pack(order, len(raw), self.size, len(ts)))
+                f.write(raw)
+                f.write(ts.tobytes())
+                f.write(status.tobytes())
+                f.write(latency.tobytes())
+        os.replace(tmp, path)
+
+    def load(self, path):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+        if not data.startswith(MAGIC):
+            return 0
+        pos, loaded = len(MAGIC), 0
+        try:
+            while pos < len(data):
+                order, nlen, _, n = _HEAD.unpack_from(data, pos)
+                pos += _HEAD.size
+                if pos + nlen + n * 7 > len(data):
+                    break   # truncated snapshot: keep what was read
+                name = data[pos:pos + nlen].decode()
+                pos += nlen
+                ring = Ring(self.size)
+                for arr, width in ((ring.ts, 4), (ring.status, 1), (ring.latency, 2)):
+                    arr.frombytes(data[pos:pos + n * width])
+                    pos += n * width
+                    if (order == b"<") != (sys.byteorder == "little"):
+                        arr.byteswap()
+                if n > self.size:   # HISTORY_SIZE was lowered since the snapshot
+                    for arr in (ring.ts, ring.status, ring.latency):
+                        del arr[:n - self.size]
+                self.rings[name] = ring
+                loaded += 1
+        except (struct.error, UnicodeDecodeError):
+            pass
+        return loaded
@@ -0,0 +1,275 @@
+import json, os, time, threading, glob
+from typing import Dict, Iterator, List, Optional
+
+# Results history as time-bucketed segment files:
+#   <dir>/<start>-<span>.jsonl      one JSON line per result
+#   <dir>/<start>-<span>.idx.json   {"start", "span", "min_ts", "max_ts",
+#                                    "checks": {name: [first_ts, last_ts, first_off, end_off, count, blocks]}}
+# blocks lists the BLOCK-sized chunks of the file where X has lines. A reader
+# for "check X, last 24h" opens only segments overlapping the window, reads
+# only those chunks, and parses only the lines naming X.
+# With several checker processes each one writes its own segments,
+# <start>-<span>-<worker>.jsonl, and readers merge them.
+
+DAY_S = 86400
+BLOCK = 64 * 1024
+
+def _seg_name(start, span, worker=None):
+    return f"{int(start):010d}-{int(span)}" + (f"-{worker}" if worker else "")
+
+class ResultsLog:
+    def __init__(self, directory, segment_s=3600, retention_s=14 * DAY_S,
+                 compact_after_s=DAY_S, flush_s=1.0, worker=None):
+        self.dir = directory
+        self.worker = worker
+        self.segment_s = int(segment_s)
+        self.retention_s = float(retention_s)
+        self.compact_after_s = float(compact_after_s)
+        self.flush_s = float(flush_s)
+        self._lock = threading.Lock()
+        self._maint_lock = threading.Lock()
+        self._f = None
+        self._start = None
+        self._pos = 0
+        self._idx = None
+        self._last_flush = 0.0
+        os.makedirs(self.dir, exist_ok=True)
+
+    # ---- writing ----
+    def append(self, rec: dict):
+        line = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+        ts = rec["ts"]
+        with self._lock:
+            if self._f is None or ts >= self._start + self.segment_s:
+                self._roll(ts)
+            off = self._pos
+            self._f.write(line)
+            self._pos += len(line)
+            _index_add(self._idx, rec["name"], ts, off, self._pos)
+            if time.monotonic() - self._last_flush >= self.flush_s:
+                self._flush_locked()
+
+    def _roll(self, ts):
+        # caller holds _lock
+        rolled = self._f is not None
+        self._close_locked()
+        self._start = int(ts // self.segment_s * self.segment_s)
+        base = os.path.join(self.dir, _seg_name(self._start, self.segment_s, self.worker))
+        self._idx = _load_index(base) or {"start": self._start, "span": self.segment_s,
+                                          "min_ts": None, "max_ts": None, "checks": {}}
+        self._f = open(base + ".jsonl", "ab", buffering=64 * 1024)
+        self._pos = self._f.tell()
+        indexed = max((e[3] for e in self._idx["checks"].values()), default=0)
+        if self._pos > indexed:
+            # Lines written after the last index write (crash): index them, and end a torn line
+            with open(base + ".jsonl", "rb") as f:
+                f.seek(indexed)
+                _index_lines(f, self._idx, indexed)
+                f.seek(self._pos - 1)
+                if f.read(1) != b"\n":
+                    self._f.write(b"\n")
+                    self._pos += 1
+        if rolled:
+            threading.Thread(target=self.maintain, name="results-maintenance", daemon=True).start()
+
+    def _flush_locked(self):
+        if self._f is None:
+            return
+        self._f.flush()
+        _write_index(os.path.join(self.dir, _seg_name(self._start, self.segment_s, self.worker)), self._idx)
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _close_locked(self):
+        if self._f is not None:
+            self._flush_locked()
+            self._f.close()
+            self._f = None
+
+    def close(self):
+        with self._lock:
+            self._close_locked()
+
+    # ---- reading ----
+    def segments(self, since=None, until=None) -> List[dict]:
+        out = []
+        for path in glob.glob(os.path.join(self.dir, "*.jsonl")):
+            base = path[:-len(".jsonl")]
+            parts = os.path.basename(base).split("-", 2)
+            try:
+                start, span = int(parts[0]), int(parts[1])
+            except (ValueError, IndexError):
+                continue
+            if since is not None and start + span <= since:
+                continue
+            if until is not None and start > until:
+                continue
+            out.append({"base": base, "start": start, "span": span,
+                        "worker": parts[2] if len(parts) > 2 else None})
+        return sorted(out, key=lambda s: s["start"])
+
+    def read(self, name=None, since=None, until=None) -> Iterator[dict]:
+        self.flush()
+        for seg in self.segments(since, until):
+            idx = _load_index(seg["base"])
+            ranges = [(0, None)]
+            if idx is not None:
+                if idx["max_ts"] is not None and since is not None and idx["max_ts"] < since:
+                    continue
+                if name is not None:
+                    e = idx["checks"].get(name)
+                    if e is None or (since is not None and e[1] < since) or (until is not None and e[0] > until):
+                        continue
+                    ranges = _block_ranges(e)
+            yield from _read_range(seg["base"] + ".jsonl", ranges, name, since, until)
+
+    # ---- retention & compaction ----
+    def maintain(self, now=None):
+        if not self._maint_lock.acquire(blocking=False):
+            return   # another maintenance pass is running
+        try:
+            now = now or time.time()
+            with self._lock:
+                active = self._start
+            self._enforce_retention(now, active)
+            self._compact(now, active)
+        except Exception as e:
+            print("Results maintenance failed:", e)
+        finally:
+            self._maint_lock.release()
+
+    def _enforce_retention(self, now, active):
+        for seg in self.segments():
+            if seg["start"] != active and seg["start"] + seg["span"] < now - self.retention_s:
+                _remove(seg["base"])
+
+    def _compact(self, now, active):
+        # Merge closed segments of the same day into one daily segment once the day is old enough
+        # (only this worker's own segments; other workers compact theirs)
+        by_day: Dict[int, list] = {}
+        for seg in self.segments():
+            if seg["span"] >= DAY_S or seg["start"] == active or seg["worker"] != self.worker:
+                continue
+            day = seg["start"] // DAY_S * DAY_S
+            if day + DAY_S + self.compact_after_s <= now:
+                by_day.setdefault(day, []).append(seg)
+        for day, segs in by_day.items():
+            base = os.path.join(self.dir, _seg_name(day, DAY_S, self.worker))
+            idx = _load_index(base) or {"start": day, "span": DAY_S, "min_ts": None, "max_ts": None, "checks": {}}
+            tmp = base + ".jsonl.tmp"
+            with open(tmp, "wb") as out:
+                if os.path.exists(base + ".jsonl"):
+                    with open(base + ".jsonl", "rb") as f:
+                        out.write(f.read())
+                for seg in segs:
+                    with open(seg["base"] + ".jsonl", "rb") as f:
+                        _index_lines(f, idx, out.tell(), out)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, base + ".jsonl")
+            _write_index(base, idx)
+            for seg in segs:
+                _remove(seg["base"])
+
+def _index_add(idx, name, ts, off, end):
+    idx["min_ts"] = min(idx["min_ts"] or ts, ts)
+    idx["max_ts"] = max(idx["max_ts"] or ts, ts)
+    e = idx["checks"].get(name)
+    b = off // BLOCK
+    if e is None:
+        idx["checks"][name] = [ts, ts, off, end, 1, [b]]
+    else:
+        e[0], e[1], e[3], e[4] = min(e[0], ts), max(e[1], ts), end, e[4] + 1
+        if len(e) > 5 and e[5][-1] != b:   # indexes from before blocks keep the plain span
+            e[5].append(b)
+
+def _block_ranges(e):
+    # [(lo, hi)] byte ranges whose lines hold a check's results: runs of
+    # consecutive blocks, or the whole first..end span for older indexes
+    if len(e) <= 5:
+        return [(e[2], e[3])]
+    out = []
+    for b in e[5]:
+        lo, hi = max(b * BLOCK, e[2]), min((b + 1) * BLOCK, e[3])
+        if out and out[-1][1] >= lo:
+            out[-1] = (out[-1][0], hi)
+        else:
+            out.append((lo, hi))
+    return out
+
+def _index_lines(f, idx, pos, out=None):
+    # Add the lines read from `f` to `idx`, as if they started at offset `pos`
+    # (optionally copying them to `out`)
+    for line in f:
+        if out is not None and not line.endswith(b"\n"):
+            line += b"\n"
+        end = pos + len(line)
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            rec = None
+        if rec is not None and line.endswith(b"\n"):
+            _index_add(idx, rec["name"], rec["ts"], pos, end)
+        if out is not None:
+            out.write(line)
+        pos = end
+    return pos
+
+def _load_index(base) -> Optional[dict]:
+    try:
+        with open(base + ".idx.json") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write_index(base, idx):
+    tmp = base + ".idx.json.tmp"
+    with open(tmp, "w") as f:
+        json.dump(idx, f)
+    os.replace(tmp, base + ".idx.json")
+
+def _remove(base):
+    for ext in (".jsonl", ".idx.json"):
+        try:
+            os.remove(base + ext)
+        except FileNotFoundError:
+            pass
+
+def _read_range(path, ranges, name, since, until):
+    # lines starting inside each [lo, hi) range (hi None = to the end); a range
+    # starting mid-line skips to the next line
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    key = ('"name": ' + json.dumps(name, ensure_ascii=False)).encode("utf-8") if name is not None else None
+    with f:
+        for lo, hi in ranges:
+            pos = lo
+            if lo > 0:
+                f.seek(lo - 1)
+                if f.read(1) != b"\n":
+                    pos += len(f.readline())
+            f.seek(pos)
+            for line in f:
+                if hi is not None and pos >= hi:
+                    break
+                pos += len(line)
+                if key is not None and key not in line:
+                    continue   # another check's line, not worth parsing
+                if not line.strip():
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue   # torn last line after a crash
+                if name is not None and rec.get("name") != name:
+                    continue
+                if since is not None and rec["ts"] < since:
+                    continue
+                if until is not None and rec["ts"] > until:
+                    continue
+                yield rec
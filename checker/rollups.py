@@ -0,0 +1,140 @@
+import random, threading, time
+from typing import Callable, Dict, List
+
+# Rolling per-check rollups kept next to record_result: each 1-minute, 1-hour
+# and 1-day bucket holds counts by status and min/max/mean/p50/p95/p99 latency.
+# A closed bucket is handed to `sink` as one row; charts read these rows
+# instead of scanning raw results. A bucket can arrive in several rows (flushed
+# at shutdown and finished after a restart, or split between workers when a
+# check changes hands); stores combine them with merge_rows.
+
+RESOLUTIONS = {"1m": 60, "1h": 3600, "1d": 86400}
+RETENTION_S = {"1m": 7 * 86400, "1h": 90 * 86400, "1d": 730 * 86400}
+MAX_SAMPLES = 512   # latency reservoir per bucket; exact below this, sampled above
+# Result lines that are not probe outcomes
+SKIP_STATUSES = {"ACTION", "ACTION_FAIL", "JOB_START", "JOB_START_FAIL"}
+
+def percentile(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    k = (len(sorted_vals) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+class Bucket:
+    __slots__ = ("start", "counts", "n", "lat_n", "lat_min", "lat_max", "lat_sum", "samples")
+
+    def __init__(self, start):
+        self.start = start
+        self.counts = {}
+        self.n = 0
+        self.lat_n = 0
+        self.lat_min = None
+        self.lat_max = None
+        self.lat_sum = 0.0
+        self.samples = []
+
+    def add(self, status, latency_ms):
+        self.n += 1
+        self.counts[status] = self.counts.get(status, 0) + 1
+        if latency_ms is None or (status == "FAIL" and not latency_ms):
+            return   # probe never got a response
+        self.lat_n += 1
+        self.lat_sum += latency_ms
+        self.lat_min = latency_ms if self.lat_min is None else min(self.lat_min, latency_ms)
+        self.lat_max = latency_ms if self.lat_max is None else max(self.lat_max, latency_ms)
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(latency_ms)
+        else:
+            j = random.randrange(self.lat_n)
+            if j < MAX_SAMPLES:
+                self.samples[j] = latency_ms
+
+    def row(self, name, res):
+        s = sorted(self.samples)
+        return {
+            "ts": self.start, "name": name, "res": res, "n": self.n, "counts": dict(self.counts),
+            "availability": round(1 - self.counts.get("FAIL", 0) / self.n, 6) if self.n else None,
+            "min": self.lat_min, "max": self.lat_max,
+            "mean": round(self.lat_sum / self.lat_n, 2) if self.lat_n else None,
+            "p50": percentile(s, 0.50), "p95": percentile(s, 0.95), "p99": percentile(s, 0.99),
+        }
+
+def _wavg(rows, key):
+    parts = [(r[key], r["n"]) for r in rows if r.get(key) is not None and r["n"]]
+    if not parts:
+        return None
+    return sum(v * w for v, w in parts) / sum(w for _, w in parts)
+
+def merge_rows(a, b):
+    """One row for two parts of the same (res, name, ts) bucket: counts add up,
+    min/max combine, mean and percentiles are n-weighted (percentiles only
+    approximately, since the samples are gone)."""
+    n = a["n"] + b["n"]
+    counts = dict(a["counts"])
+    for k, v in b["counts"].items():
+        counts[k] = counts.get(k, 0) + v
+    mins = [r["min"] for r in (a, b) if r.get("min") is not None]
+    maxs = [r["max"] for r in (a, b) if r.get("max") is not None]
+    mean = _wavg((a, b), "mean")
+    return {
+        **a, "n": n, "counts": counts,
+        "availability": round(1 - counts.get("FAIL", 0) / n, 6) if n else None,
+        "min": min(mins) if mins else None, "max": max(maxs) if maxs else None,
+        "mean": round(mean, 2) if mean is not None else None,
+        "p50": _wavg((a, b), "p50"), "p95": _wavg((a, b), "p95"), "p99": _wavg((a, b), "p99"),
+    }
+
+class Rollups:
+    def __init__(self, sink: Callable[[List[dict]], None], resolutions=RESOLUTIONS, tick_s=5.0):
+        self.sink = sink
+        self.resolutions = dict(resolutions)
+        self.tick_s = tick_s
+        self._lock = threading.Lock()
+        self._open: Dict[tuple, Bucket] = {}   # (name, res) -> open bucket
+        self._last_tick = 0.0
+
+    def add(self, name, status, latency_ms, ts=None):
+        if status in SKIP_STATUSES:
+            return
+        ts = ts or time.time()
+        closed = []
+        with self._lock:
+            for res, span in self.resolutions.items():
+                start = ts // span * span
+                b = self._open.get((name, res))
+                if b is None or b.start != start:
+                    if b is not None and b.start < start:
+                        closed.append(b.row(name, res))
+                    b = self._open[(name, res)] = Bucket(start)
+                b.add(status, latency_ms)
+            if ts - self._last_tick >= self.tick_s:
+                self._last_tick = ts
+                closed += self._close_expired(ts)
+        if closed:
+            self.sink(closed)
+
+    def _close_expired(self, now):
+        # caller holds _lock; closes buckets of checks that stopped reporting
+        rows = []
+        for (name, res), b in list(self._open.items()):
+            if b.start + self.resolutions[res] <= now:
+                rows.append(b.row(name, res))
+                del self._open[(name, res)]
+        return rows
+
+    def tick(self, now=None):
+        with self._lock:
+            rows = self._close_expired(now or time.time())
+        if rows:
+            self.sink(rows)
+
+    def flush_open(self):
+        # Emit open buckets as they stand (at shutdown) and start them over; a
+        # later row for the same (res, name, ts) is merged with this one.
+        with self._lock:
+            rows = [b.row(name, res) for (name, res), b in self._open.items()]
+            self._open.clear()
+        if rows:
+            self.sink(rows)
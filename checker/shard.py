@@ -0,0 +1,118 @@
+import hashlib, os, socket, sqlite3, threading, time
+
+# Lease-based check ownership for running several checker processes.
+# Every worker renews a membership lease in a shared SQLite file; checks are
+# split over the live workers by rendezvous (highest-random-weight) hashing,
+# so a worker joining or leaving only moves its own share. A worker runs a
+# check only while it holds that check's lease. When a worker dies its leases
+# run out and the survivors claim its checks on their next renewal.
+
+LEASE_DB = os.environ.get("LEASE_DB", "./leases.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers(id TEXT PRIMARY KEY, expires_at REAL NOT NULL, started_at REAL);
+CREATE TABLE IF NOT EXISTS leases(name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS leases_owner ON leases(owner);
+"""
+SQL_RENEW_WORKER = """
+INSERT INTO workers(id, expires_at, started_at) VALUES(?,?,?)
+ON CONFLICT(id) DO UPDATE SET expires_at=excluded.expires_at
+"""
+SQL_LIVE_WORKERS = "SELECT id FROM workers WHERE expires_at>=?"
+SQL_DROP_WORKERS = "DELETE FROM workers WHERE expires_at<?"
+# Take the lease if it is free, expired, or already ours
+SQL_CLAIM = """
+INSERT INTO leases(name, owner, expires_at) VALUES(?,?,?)
+ON CONFLICT(name) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at
+WHERE leases.owner=excluded.owner OR leases.expires_at<?
+"""
+SQL_RELEASE = "UPDATE leases SET expires_at=0 WHERE owner=? AND name=?"
+SQL_OWNED = "SELECT name FROM leases WHERE owner=? AND expires_at>=?"
+
+def default_worker_id():
+    return os.environ.get("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+def _score(worker, name):
+    return hashlib.blake2b(f"{worker}\0{name}".encode(), digest_size=8).digest()
+
+def owner_of(name, workers):
+    return max(workers, key=lambda w: _score(w, name)) if workers else None
+
+class Shard:
+    def __init__(self, names, worker_id=None, lease_s=15.0, path=LEASE_DB, on_gain=None):
+        self.id = worker_id or default_worker_id()
+        self.lease_s = float(lease_s)
+        self.names = list(names)
+        self.on_gain = on_gain
+        self.owned = frozenset()
+        self.workers = ()
+        self._valid_until = 0.0
+        self._con = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA busy_timeout=10000")
+        self._con.executescript(SCHEMA)
+        self._stop = threading.Event()
+        self._thread = None
+        # one connection for the lease thread and reloads: transactions must not interleave
+        self._lock = threading.Lock()
+
+    def owns(self, name):
+        # Stop running checks once our leases may have run out (e.g. the lease db is unreachable)
+        return name in self.owned and time.time() < self._valid_until
+
+    def set_names(self, names):
+        with self._lock:
+            self.names = list(names)
+
+    def tick(self, now=None):
+        with self._lock:
+            return self._tick(now)
+
+    def _tick(self, now=None):
+        now = now or time.time()
+        expires = now + self.lease_s
+        con = self._con
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.execute(SQL_RENEW_WORKER, (self.id, expires, now))
+            con.execute(SQL_DROP_WORKERS, (now - 10 * self.lease_s,))
+            workers = sorted(r[0] for r in con.execute(SQL_LIVE_WORKERS, (now,)))
+            mine = {n for n in self.names if owner_of(n, workers) == self.id}
+            con.executemany(SQL_RELEASE, [(self.id, n) for n in self.owned - mine])
+            con.executemany(SQL_CLAIM, [(n, self.id, expires, now) for n in mine])
+            owned = frozenset(r[0] for r in con.execute(SQL_OWNED, (self.id, now))) & mine
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        gained = owned - self.owned
+        if gained and self.on_gain:
+            self.on_gain(gained)
+        if workers != list(self.workers) or owned != self.owned:
+            print(f"Worker {self.id}: {len(owned)}/{len(self.names)} checks, {len(workers)} live workers")
+        self.workers, self.owned, self._valid_until = tuple(workers), owned, expires
+        return gained
+
+    def _loop(self):
+        while not self._stop.wait(self.lease_s / 3):
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Worker {self.id}: lease renewal failed: {e}")
+
+    def start(self):
+        self.tick()
+        self._thread = threading.Thread(target=self._loop, name="shard-leases", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Hand our checks over right away instead of waiting for the leases to expire
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.lease_s)
+        with self._lock:
+            self.owned = frozenset()
+            self._con.execute("BEGIN IMMEDIATE")
+            self._con.execute("UPDATE leases SET expires_at=0 WHERE owner=?", (self.id,))
+            self._con.execute("DELETE FROM workers WHERE id=?", (self.id,))
+            self._con.execute("COMMIT")
@@ -0,0 +1,70 @@
+import math, threading, time
+from array import array
+
+# Fixed-memory rolling latency quantiles (HDR-histogram style). Values go into
+# log-spaced buckets (each GROWTH times wider than the last, so any quantile is
+# within ~4% of the true value). The window is split into SLOTS sub-histograms
+# that are recycled as time moves on, so memory stays at
+# SLOTS * buckets * 4 bytes (~3.6 KB) per check however long the checker runs.
+
+GROWTH = 1.08
+MAX_MS = 120_000
+SLOTS = 6
+_LOG_G = math.log(GROWTH)
+NBUCKETS = int(math.ceil(math.log(MAX_MS) / _LOG_G)) + 2
+
+def _bucket(v):
+    if v < 1:
+        return 0
+    return min(NBUCKETS - 1, int(math.log(v) / _LOG_G) + 1)
+
+def _upper(i):
+    return 1.0 if i == 0 else GROWTH ** i
+
+class LatencySketch:
+    __slots__ = ("window_s", "slot_s", "_counts", "_slot_ids", "_lock")
+
+    def __init__(self, window_s=300.0):
+        self.window_s = float(window_s)
+        self.slot_s = self.window_s / SLOTS
+        self._counts = [array("I", [0]) * NBUCKETS for _ in range(SLOTS)]
+        self._slot_ids = [-1] * SLOTS
+        self._lock = threading.Lock()
+
+    def add(self, latency_ms, ts=None):
+        sid = int((ts or time.time()) // self.slot_s)
+        i = sid % SLOTS
+        with self._lock:
+            if self._slot_ids[i] != sid:
+                # slot last used a full window ago: recycle it
+                self._counts[i] = array("I", [0]) * NBUCKETS
+                self._slot_ids[i] = sid
+            self._counts[i][_bucket(latency_ms)] += 1
+
+    def _merged(self, now):
+        sid = int(now // self.slot_s)
+        live = [c for c, s in zip(self._counts, self._slot_ids) if sid - SLOTS < s <= sid]
+        return [sum(col) for col in zip(*live)] if live else []
+
+    def count(self, now=None):
+        with self._lock:
+            return sum(self._merged(now or time.time()))
+
+    def quantiles(self, qs, now=None):
+        # -> {q: value_ms or None}; one pass over the merged buckets for all qs
+        with self._lock:
+            merged = self._merged(now or time.time())
+        total = sum(merged)
+        if not total:
+            return {q: None for q in qs}
+        out, seen, i = {}, 0, 0
+        for q in sorted(qs):
+            rank = max(1, math.ceil(q * total))
+            while seen + merged[i] < rank:
+                seen += merged[i]
+                i += 1
+            out[q] = round(_upper(i), 1)
+        return out
+
+    def quantile(self, q, now=None):
+        return self.quantiles([q], now)[q]
@@ -1,7 +1,10 @@
-import sqlite3, json, os, time
-from contextlib import contextmanager
+import sqlite3, json, os, time, threading, atexit
+from typing import Dict, Any, List, Optional
+from .rollups import RETENTION_S, merge_rows
 
 DB_PATH = os.environ.get("DB_URL", "sqlite:///./monitor.db").replace("sqlite:///","")
+FLUSH_INTERVAL_S = float(os.environ.get("STATE_FLUSH_S", "1"))
+BATCH_SIZE = int(os.environ.get("DB_BATCH_SIZE", "500"))
 
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS checks_state(
@@ -19,61 +22,232 @@ CREATE TABLE IF NOT EXISTS results(
   latency_ms REAL,
   details_json TEXT
 );
+CREATE INDEX IF NOT EXISTS results_name_ts ON results(name, ts);
+CREATE INDEX IF NOT EXISTS results_ts ON results(ts);
+CREATE TABLE IF NOT EXISTS rollups(
+  res TEXT NOT NULL,
+  name TEXT NOT NULL,
+  ts REAL NOT NULL,
+  n INTEGER,
+  counts_json TEXT,
+  availability REAL,
+  min REAL, max REAL, mean REAL, p50 REAL, p95 REAL, p99 REAL,
+  PRIMARY KEY(res, name, ts)
+);
+CREATE INDEX IF NOT EXISTS rollups_res_ts ON rollups(res, ts);
 """
 
-@contextmanager
-def _conn():
-    con = sqlite3.connect(DB_PATH)
-    try:
-        yield con
-    finally:
-        con.close()
-
-def init_db():
-    with _conn() as c:
-        for stmt in SCHEMA.strip().split(";"):
-            s = stmt.strip()
-            if s:
-                c.execute(s)
-        c.commit()
+# Statements are module constants so sqlite3's per-connection statement cache
+# prepares each one once.
+SQL_INSERT_RESULT = "INSERT INTO results(ts,name,status,latency_ms,details_json) VALUES(?,?,?,?,?)"
+SQL_UPSERT_STATE = """
+INSERT INTO checks_state(name,status,first_failed_at,last_changed_at,consecutive_failures,last_notification_at)
+VALUES(:name,:status,:first_failed_at,:last_changed_at,:consecutive_failures,:last_notification_at)
+ON CONFLICT(name) DO UPDATE SET
+  status=excluded.status, first_failed_at=excluded.first_failed_at,
+  last_changed_at=excluded.last_changed_at, consecutive_failures=excluded.consecutive_failures,
+  last_notification_at=excluded.last_notification_at
+"""
+SQL_SELECT_STATES = "SELECT name,status,first_failed_at,last_changed_at,consecutive_failures,last_notification_at FROM checks_state"
+SQL_SELECT_RESULTS = "SELECT ts,name,status,latency_ms,details_json FROM results WHERE ts>=? AND ts<=?"
+SQL_SELECT_RESULTS_BY_NAME = SQL_SELECT_RESULTS + " AND name=?"
+SQL_UPSERT_ROLLUP = """
+INSERT OR REPLACE INTO rollups(res,name,ts,n,counts_json,availability,min,max,mean,p50,p95,p99)
+VALUES(:res,:name,:ts,:n,:counts_json,:availability,:min,:max,:mean,:p50,:p95,:p99)
+"""
+ROLLUP_COLUMNS = ["res","name","ts","n","counts_json","availability","min","max","mean","p50","p95","p99"]
+SQL_SELECT_ROLLUPS = f"SELECT {','.join(ROLLUP_COLUMNS)} FROM rollups WHERE res=? AND ts>=? AND ts<=?"
+SQL_SELECT_ROLLUPS_BY_NAME = SQL_SELECT_ROLLUPS + " AND name=?"
+SQL_SELECT_ROLLUP = f"SELECT {','.join(ROLLUP_COLUMNS)} FROM rollups WHERE res=? AND name=? AND ts=?"
+SQL_PRUNE_ROLLUPS = "DELETE FROM rollups WHERE res=? AND ts<?"
 
-def upsert_state(name, status, now=None, fail=False):
+# One persistent connection in WAL mode: readers (dashboard) never block the
+# writer. State lives in memory for O(1) lookups; results and changed states are
+# written in one transaction per flush.
+_con: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+_state: Dict[str, Any] = {}
+_dirty = set()
+_pending: List[tuple] = []
+_pending_rollups: List[dict] = []
+_last_prune = 0.0
+_flusher = None
+
+def connect(path=DB_PATH, readonly=False):
+    uri = f"file:{path}?mode=ro" if readonly else f"file:{path}"
+    con = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None,
+                          cached_statements=256, timeout=5)
+    con.execute("PRAGMA busy_timeout=5000")
+    if not readonly:
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+    return con
+
+def init_store():
+    global _con, _state
+    with _lock:
+        if _con is None:
+            _con = connect()
+            _con.executescript(SCHEMA)
+        cur = _con.execute(SQL_SELECT_STATES)
+        cols = [d[0] for d in cur.description]
+        _state = {row[0]: dict(zip(cols[1:], row[1:])) for row in cur.fetchall()}
+    _start_flusher()
+
+init_db = init_store
+
+def _start_flusher():
+    global _flusher
+    if _flusher is None and FLUSH_INTERVAL_S > 0:
+        _flusher = threading.Thread(target=_flush_loop, name="sqlite-flusher", daemon=True)
+        _flusher.start()
+        atexit.register(flush)
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL_S)
+        try:
+            flush()
+        except Exception as e:
+            print("SQLite flush failed:", e)
+
+def flush():
+    global _last_prune
+    with _lock:
+        if _con is None or (not _pending and not _dirty and not _pending_rollups):
+            return
+        rows, names, rollups = list(_pending), list(_dirty), list(_pending_rollups)
+        _pending.clear()
+        _dirty.clear()
+        _pending_rollups.clear()
+        now = time.time()
+        try:
+            _con.execute("BEGIN")
+            if rows:
+                _con.executemany(SQL_INSERT_RESULT, rows)
+            if names:
+                _con.executemany(SQL_UPSERT_STATE, [{"name": n, **_state[n]} for n in names])
+            for r in rollups:
+                _upsert_rollup(r)
+            if now - _last_prune > 3600:
+                _con.executemany(SQL_PRUNE_ROLLUPS, [(res, now - keep) for res, keep in RETENTION_S.items()])
+                _last_prune = now
+            _con.execute("COMMIT")
+        except Exception:
+            _con.execute("ROLLBACK")
+            _pending[:0] = rows
+            _dirty.update(names)
+            _pending_rollups[:0] = rollups
+            raise
+
+def _rollup_row(row):
+    r = dict(zip(ROLLUP_COLUMNS, row))
+    r["counts"] = json.loads(r.pop("counts_json") or "{}")
+    return r
+
+def _upsert_rollup(r):
+    # caller holds _lock inside a transaction; a bucket already stored (partial
+    # before a restart, or from another worker) is merged, not replaced
+    old = _con.execute(SQL_SELECT_ROLLUP, (r["res"], r["name"], r["ts"])).fetchone()
+    if old is not None:
+        r = merge_rows(_rollup_row(old), r)
+    _con.execute(SQL_UPSERT_ROLLUP, {**{k: r[k] for k in ROLLUP_COLUMNS if k != "counts_json"},
+                                     "counts_json": json.dumps(r["counts"])})
+
+def _after_write(batch_full=False):
+    if FLUSH_INTERVAL_S <= 0 or batch_full:
+        flush()
+
+def refresh(names):
+    # Reload these checks' state from the database (this worker just took them
+    # over from another one); rows are upserted per check, so workers never
+    # overwrite each other's checks
+    names = list(names)
+    with _lock:
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            cur = _con.execute(SQL_SELECT_STATES + f" WHERE name IN ({','.join('?' * len(chunk))})", chunk)
+            cols = [d[0] for d in cur.description]
+            for row in cur.fetchall():
+                if row[0] not in _dirty:
+                    _state[row[0]] = dict(zip(cols[1:], row[1:]))
+
+def get_state(name: str) -> Optional[dict]:
+    with _lock:
+        cur = _state.get(name)
+        return dict(cur) if cur else None
+
+def transition(name: str, status: str, now: float = None, fail: bool = False) -> Optional[str]:
     now = now or time.time()
-    with _conn() as c:
-        cur = c.cursor()
-        cur.execute("SELECT status, consecutive_failures FROM checks_state WHERE name=?", (name,))
-        row = cur.fetchone()
-        if not row:
-            cur.execute(
-              "INSERT INTO checks_state(name,status,first_failed_at,last_changed_at,consecutive_failures,last_notification_at) VALUES(?,?,?,?,?,?)",
-              (name, status, now if fail else None, now, 1 if fail else 0, None))
+    with _lock:
+        cur = _state.get(name)
+        prev_status = cur["status"] if cur else None
+        if not cur:
+            cur = {"status": status, "first_failed_at": now if fail else None, "last_changed_at": now,
+                   "consecutive_failures": 1 if fail else 0, "last_notification_at": None}
         else:
-            prev_status, prev_cf = row
-            cf = (prev_cf + 1) if fail else 0
-            set_first_fail = "first_failed_at=COALESCE(first_failed_at, ?)," if fail and prev_cf == 0 else ""
-            args = []
-            if fail and prev_cf == 0:
-                args.append(now)
-            sql = f"UPDATE checks_state SET status=?, {set_first_fail} last_changed_at=?, consecutive_failures=? WHERE name=?"
-            args = [status] + args + [now, cf, name]
-            cur.execute(sql, tuple(args))
-        c.commit()
+            cur["status"] = status
+            if fail:
+                if prev_status != "FAIL":
+                    cur["first_failed_at"] = cur["first_failed_at"] or now
+                cur["consecutive_failures"] = (cur.get("consecutive_failures") or 0) + 1
+            else:
+                cur["consecutive_failures"] = 0
+            if prev_status != status:
+                cur["last_changed_at"] = now
+        _state[name] = cur
+        _dirty.add(name)
+    _after_write()
+    return prev_status
+
+def upsert_state(name, status, now=None, fail=False):
+    transition(name, status, now, fail)
 
 def record_result(name, status, latency_ms, details):
-    with _conn() as c:
-        c.execute(
-          "INSERT INTO results(ts,name,status,latency_ms,details_json) VALUES(?,?,?,?,?)",
-          (time.time(), name, status, latency_ms, json.dumps(details)[:2000]))
-        c.commit()
-
-def read_states():
-    with _conn() as c:
-        cur = c.cursor()
-        cur.execute("SELECT name,status,first_failed_at,last_changed_at,consecutive_failures,last_notification_at FROM checks_state")
-        rows = cur.fetchall()
-        return rows
+    with _lock:
+        _pending.append((time.time(), name, status, latency_ms, json.dumps(details)[:2000]))
+        full = len(_pending) >= BATCH_SIZE
+    _after_write(full)
+
+def write_rollups(rows: List[dict]):
+    with _lock:
+        _pending_rollups.extend(rows)
+    _after_write()
+
+def query_rollups(res: str, name: str = None, since: float = None, until: float = None) -> List[dict]:
+    flush()
+    args = [res, since if since is not None else 0, until if until is not None else float("inf")]
+    sql = SQL_SELECT_ROLLUPS
+    if name is not None:
+        sql, args = SQL_SELECT_ROLLUPS_BY_NAME, args + [name]
+    with _lock:
+        rows = _con.execute(sql + " ORDER BY ts", args).fetchall()
+    return [_rollup_row(row) for row in rows]
+
+def read_states() -> List[dict]:
+    with _lock:
+        return [{"name": k, **v} for k, v in _state.items()]
 
 def update_last_notification(name):
-    with _conn() as c:
-        c.execute("UPDATE checks_state SET last_notification_at=? WHERE name=?", (time.time(), name))
-        c.commit()
+    with _lock:
+        if name in _state:
+            _state[name]["last_notification_at"] = time.time()
+            _dirty.add(name)
+    _after_write()
+
+def query_results(name: str = None, since: float = None, until: float = None) -> List[dict]:
+    flush()
+    args = [since if since is not None else 0, until if until is not None else float("inf")]
+    sql = SQL_SELECT_RESULTS
+    if name is not None:
+        sql, args = SQL_SELECT_RESULTS_BY_NAME, args + [name]
+    with _lock:
+        rows = _con.execute(sql + " ORDER BY ts", args).fetchall()
+    return [{"ts": ts, "name": n, "status": st, "latency_ms": lat, "details": _details(d)}
+            for ts, n, st, lat, d in rows]
+
+def _details(d):
+    try:
+        return json.loads(d or "{}")
+    except ValueError:
+        return {"raw": d}   # details_json is capped at 2000 chars
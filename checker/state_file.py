@@ -1,14 +1,36 @@
-import json, os, time, threading
-from typing import Dict, Any, List
+import json, os, time, threading, atexit
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:   # Windows: single process only
+    fcntl = None
+from typing import Dict, Any, List, Optional
+from .results_log import ResultsLog, DAY_S
+from .rollups import RESOLUTIONS, RETENTION_S, merge_rows
 
 STATE_PATH = os.environ.get("STATE_PATH", "./state.json")
-RESULTS_PATH = os.environ.get("RESULTS_PATH", "./results.json")
+RESULTS_DIR = os.environ.get("RESULTS_DIR", "./results")
+RESULTS_SEGMENT_S = int(os.environ.get("RESULTS_SEGMENT_S", "3600"))
+RESULTS_RETENTION_DAYS = float(os.environ.get("RESULTS_RETENTION_DAYS", "14"))
+ROLLUPS_DIR = os.environ.get("ROLLUPS_DIR", "./rollups")
+# Write-behind: updates mark the state dirty and a background thread writes
+# state.json at most once per interval (0 = write on every update)
+FLUSH_INTERVAL_S = float(os.environ.get("STATE_FLUSH_S", "1"))
+# Set when several checker processes share these files (checker/workers.py):
+# each writes its own results segments, and state.json is merged under a
+# file lock so every worker's checks end up in one file.
+WORKER_ID = os.environ.get("WORKER_ID") or None
 _lock = threading.Lock()
+_flush_lock = threading.Lock()
+_dirty = set()   # names changed since the last write
+_flusher = None
 
 _state: Dict[str, Any] = {}  # name -> {status, first_failed_at, last_changed_at, consecutive_failures, last_notification_at}
+_results: Optional[ResultsLog] = None
+_rollups: Dict[str, ResultsLog] = {}   # resolution -> log of rollup rows (one daily segment each)
 
 def init_store():
-    global _state
+    global _state, _results, _rollups
     if os.path.exists(STATE_PATH):
         try:
             _state = json.load(open(STATE_PATH, "r"))
@@ -16,20 +38,117 @@ def init_store():
             _state = {}
     else:
         _state = {}
-    # ensure files exist
-    if not os.path.exists(RESULTS_PATH):
-        open(RESULTS_PATH, "a").close()
+    _results = ResultsLog(RESULTS_DIR, segment_s=RESULTS_SEGMENT_S,
+                          retention_s=RESULTS_RETENTION_DAYS * DAY_S,
+                          flush_s=max(FLUSH_INTERVAL_S, 0), worker=WORKER_ID)
+    _results.maintain()
+    _rollups = {res: ResultsLog(os.path.join(ROLLUPS_DIR, res), segment_s=DAY_S,
+                                retention_s=RETENTION_S[res], flush_s=max(FLUSH_INTERVAL_S, 0),
+                                worker=WORKER_ID)
+                for res in RESOLUTIONS}
+    _start_flusher()
 
-def _flush_state():
-    tmp = STATE_PATH + ".tmp"
+def _start_flusher():
+    global _flusher
+    if _flusher is None and FLUSH_INTERVAL_S > 0:
+        _flusher = threading.Thread(target=_flush_loop, name="state-flusher", daemon=True)
+        _flusher.start()
+        atexit.register(flush)
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL_S)
+        try:
+            flush()
+        except Exception as e:
+            print("State flush failed:", e)
+
+def flush():
+    # Atomic replace: a crash leaves either the old or the new state.json, never half of one
+    if _results is not None:
+        _results.flush()
+    for log in _rollups.values():
+        log.flush()
+    with _flush_lock:
+        if not WORKER_ID:
+            with _lock:
+                if not _dirty:
+                    return
+                data = json.dumps(_state)
+                _dirty.clear()
+            _write_state(data)
+            return
+        # Shared file: take other workers' latest entries, write ours over them
+        with _file_lock():
+            disk = _read_disk()
+            with _lock:
+                names = set(_dirty)
+                for name, entry in disk.items():
+                    if name not in names:
+                        _state[name] = entry
+                if not names:
+                    return
+                disk.update({n: _state[n] for n in names if n in _state})
+                data = json.dumps(disk)
+                _dirty.clear()
+            _write_state(data)
+
+def _write_state(data):
+    tmp = f"{STATE_PATH}.{os.getpid()}.tmp"
     with open(tmp, "w") as f:
-        json.dump(_state, f)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
     os.replace(tmp, STATE_PATH)
 
-def upsert_state(name: str, status: str, now: float = None, fail: bool = False):
+@contextmanager
+def _file_lock():
+    if fcntl is None:
+        yield
+        return
+    with open(STATE_PATH + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _read_disk():
+    try:
+        with open(STATE_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def refresh(names):
+    # Reload these checks' state from disk (this worker just took them over)
+    with _file_lock():
+        disk = _read_disk()
+    with _lock:
+        for name in names:
+            if name in disk and name not in _dirty:
+                _state[name] = disk[name]
+
+def _mark_dirty(name):
+    # caller holds _lock
+    _dirty.add(name)
+
+def _after_write():
+    # caller has released _lock
+    if FLUSH_INTERVAL_S <= 0:
+        flush()
+
+def get_state(name: str) -> Optional[dict]:
+    with _lock:
+        cur = _state.get(name)
+        return dict(cur) if cur else None
+
+def transition(name: str, status: str, now: float = None, fail: bool = False) -> Optional[str]:
+    """Record the new status for `name` and return the previous one (None if new)."""
     now = now or time.time()
     with _lock:
         cur = _state.get(name)
+        prev_status = cur["status"] if cur else None
         if not cur:
             cur = {
                 "status": status,
@@ -39,7 +158,6 @@ def upsert_state(name: str, status: str, now: float = None, fail: bool = False):
                 "last_notification_at": None
             }
         else:
-            prev_status = cur["status"]
             prev_cf = cur.get("consecutive_failures", 0)
             cur["status"] = status
             if fail:
@@ -51,7 +169,12 @@ def upsert_state(name: str, status: str, now: float = None, fail: bool = False):
             if prev_status != status:
                 cur["last_changed_at"] = now
         _state[name] = cur
-        _flush_state()
+        _mark_dirty(name)
+    _after_write()
+    return prev_status
+
+def upsert_state(name: str, status: str, now: float = None, fail: bool = False):
+    transition(name, status, now, fail)
 
 def record_result(name: str, status: str, latency_ms: float, details: dict):
     rec = {
@@ -61,9 +184,25 @@ def record_result(name: str, status: str, latency_ms: float, details: dict):
         "latency_ms": latency_ms,
         "details": details
     }
-    line = json.dumps(rec, ensure_ascii=False)
-    with _lock, open(RESULTS_PATH, "a") as f:
-        f.write(line + "\n")
+    _results.append(rec)
+
+def query_results(name: str = None, since: float = None, until: float = None) -> List[dict]:
+    rows = list(_results.read(name, since, until))
+    if WORKER_ID:
+        rows.sort(key=lambda r: r["ts"])   # segments of several workers
+    return rows
+
+def write_rollups(rows: List[dict]):
+    for row in rows:
+        _rollups[row["res"]].append(row)
+
+def query_rollups(res: str, name: str = None, since: float = None, until: float = None) -> List[dict]:
+    # Rows for the same bucket (partial at a restart, or from two workers) are merged
+    rows = {}
+    for row in _rollups[res].read(name, since, until):
+        key = (row["name"], row["ts"])
+        rows[key] = merge_rows(rows[key], row) if key in rows else row
+    return sorted(rows.values(), key=lambda r: r["ts"])
 
 def read_states() -> List[dict]:
     with _lock:
@@ -73,4 +212,5 @@ def update_last_notification(name: str):
     with _lock:
         if name in _state:
             _state[name]["last_notification_at"] = time.time()
-            _flush_state()
+            _mark_dirty(name)
+    _after_write()
@@ -0,0 +1,99 @@
+import importlib, os, threading, time
+from .feed import FEED
+from .recent import Recent
+from .rollups import Rollups
+
+# Storage backends share one interface; main.py and notify.py call these
+# wrappers and the backend is picked from `global.storage` in checks.yaml
+# (or the STORE_BACKEND env var).
+BACKENDS = {
+    "file": ".state_file",
+    "sqlite": ".state",
+}
+
+# Recent results per check (checker/recent.py), snapshotted next to the state
+# every HISTORY_SNAPSHOT_S and on exit, and reloaded on start
+HISTORY_SIZE = int(os.environ.get("HISTORY_SIZE", "2048"))
+HISTORY_SNAPSHOT_S = float(os.environ.get("HISTORY_SNAPSHOT_S", "60"))
+_worker = os.environ.get("WORKER_ID")
+HISTORY_PATH = os.environ.get("HISTORY_PATH") or (f"./history-{_worker}.bin" if _worker else "./history.bin")
+
+_backend = None
+RECENT = Recent(HISTORY_SIZE)
+_snapshotter = None
+# Rollups are maintained here, next to record_result, for every backend
+_rollups = Rollups(lambda rows: backend().write_rollups(rows))
+
+def use(name=None):
+    global _backend
+    name = os.environ.get("STORE_BACKEND") or name or "file"
+    if name not in BACKENDS:
+        raise ValueError(f"unknown storage backend {name!r}, expected one of {sorted(BACKENDS)}")
+    _backend = importlib.import_module(BACKENDS[name], __package__)
+    return _backend
+
+def backend():
+    return _backend or use()
+
+def init_store():
+    global _snapshotter
+    backend().init_store()
+    t0 = time.perf_counter()
+    n = RECENT.load(HISTORY_PATH)
+    if n:
+        print(f"Loaded recent results of {n} checks in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    if _snapshotter is None and HISTORY_SNAPSHOT_S > 0:
+        _snapshotter = threading.Thread(target=_snapshot_loop, name="history-snapshot", daemon=True)
+        _snapshotter.start()
+
+def _snapshot_loop():
+    while True:
+        time.sleep(HISTORY_SNAPSHOT_S)
+        try:
+            RECENT.save(HISTORY_PATH)
+        except OSError as e:
+            print(f"history snapshot failed: {e}")
+
+def get_state(name):
+    return backend().get_state(name)
+
+def transition(name, status, now=None, fail=False):
+    return backend().transition(name, status, now, fail)
+
+def record_result(name, status, latency_ms, details):
+    backend().record_result(name, status, latency_ms, details)
+    _rollups.add(name, status, latency_ms)
+    RECENT.add(name, time.time(), status, latency_ms)
+    FEED.append(name, status, latency_ms, details)
+
+def read_states():
+    return backend().read_states()
+
+def update_last_notification(name):
+    backend().update_last_notification(name)
+
+def query_results(name=None, since=None, until=None):
+    return backend().query_results(name, since, until)
+
+def query_rollups(res, name=None, since=None, until=None):
+    return backend().query_rollups(res, name, since, until)
+
+def recent(name, since=None, last=None):
+    """(ts, status codes, latency ms) arrays of the check's newest results;
+    codes index recent.STATUSES."""
+    return RECENT.window(name, since, last)
+
+def forget(name):
+    RECENT.drop(name)
+
+def refresh(names):
+    backend().refresh(names)
+
+def flush():
+    backend().flush()
+
+def close():
+    # Shutdown: write partially filled rollup buckets too, then flush everything
+    _rollups.flush_open()
+    flush()
+    RECENT.save(HISTORY_PATH)
@@ -0,0 +1,71 @@
+import os, signal, subprocess, sys, time, yaml
+
+# Runs N checker processes that share checks.yaml, state and results:
+#   python -m checker.workers 4
+# Each worker gets WORKER_ID=w<i> and its own metrics and API ports (port + i).
+# A worker that exits is restarted; until then the others take over its checks.
+# One that keeps dying right after start (bad config, port in use) is restarted
+# with exponential backoff and given up on after MAX_FAST_EXITS in a row.
+
+RESTART_DELAY_S = 2
+MAX_RESTART_DELAY_S = 120
+FAST_EXIT_S = 30        # a worker that ran less than this counts as a failed start
+MAX_FAST_EXITS = 5
+
+def spawn(i, base_port, api_port):
+    env = {**os.environ, "WORKER_ID": f"w{i}", "METRICS_PORT": str(base_port + i if base_port else 0),
+           "API_PORT": str(api_port + i if api_port else 0)}
+    return subprocess.Popen([sys.executable, "-m", "checker.main"], env=env)
+
+def _sigterm(*_):
+    raise KeyboardInterrupt
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    n = int(argv[0]) if argv else os.cpu_count() or 2
+    with open(os.getenv("CHECKS_PATH", "checks.yaml")) as f:
+        cfg = yaml.safe_load(f) or {}
+    metrics_cfg = (cfg.get("global") or {}).get("metrics") or {}
+    base_port = int(os.getenv("METRICS_PORT", metrics_cfg.get("port", 0)))
+    api_port = int(os.getenv("API_PORT", ((cfg.get("global") or {}).get("api") or {}).get("port", 0)))
+    procs = {i: spawn(i, base_port, api_port) for i in range(n)}
+    started = {i: time.monotonic() for i in procs}
+    fast_exits = {i: 0 for i in procs}
+    restart_at = {}   # i -> monotonic time of the next start
+    print(f"Started {n} checker workers. Press Ctrl+C to stop.")
+    signal.signal(signal.SIGTERM, _sigterm)
+    try:
+        while procs or restart_at:
+            time.sleep(1)
+            now = time.monotonic()
+            for i, p in list(procs.items()):
+                if p.poll() is None:
+                    continue
+                del procs[i]
+                fast_exits[i] = fast_exits[i] + 1 if now - started[i] < FAST_EXIT_S else 0
+                if fast_exits[i] >= MAX_FAST_EXITS:
+                    print(f"Worker w{i} exited with {p.returncode} {fast_exits[i]} times in a row right after "
+                          f"starting; giving up on it (its checks move to the other workers)")
+                    continue
+                delay = min(RESTART_DELAY_S * 2 ** max(fast_exits[i] - 1, 0), MAX_RESTART_DELAY_S)
+                print(f"Worker w{i} exited with {p.returncode}; restarting in {delay}s")
+                restart_at[i] = now + delay
+            for i, at in list(restart_at.items()):
+                if now >= at:
+                    del restart_at[i]
+                    procs[i] = spawn(i, base_port, api_port)
+                    started[i] = now
+        print("All workers gave up; see the errors above")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        for p in procs.values():
+            if p.poll() is None:
+                p.send_signal(signal.SIGTERM)
+        for p in procs.values():
+            try:
+                p.wait(20)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,289 @@
-import json, time, pandas as pd, streamlit as st, os
+import json, time, pandas as pd, streamlit as st, os, glob, threading, sqlite3, sys, yaml, requests
 import pytz
+from collections import deque
 from datetime import datetime, timezone, timedelta
 
+# `streamlit run dashboard/app.py` only puts dashboard/ on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from checker.rollups import merge_rows
+
 STATE_PATH = os.environ.get("STATE_PATH", "./state.json")
-RESULTS_PATH = os.environ.get("RESULTS_PATH", "./results.json")
+RESULTS_DIR = os.environ.get("RESULTS_DIR", "./results")
+DB_PATH = os.environ.get("DB_URL", "sqlite:///./monitor.db").replace("sqlite:///","")
+ROLLUPS_DIR = os.environ.get("ROLLUPS_DIR", "./rollups")
+ROLLUP_WINDOWS = {"1m": 6 * 3600, "1h": 14 * 86400, "1d": 365 * 86400}   # how far back each chart goes
+# status -> (text color, card background); WARN/CRIT are slow-but-up (latency thresholds)
+STATUS_COLORS = {"OK": ("#16a34a", "#ecfdf5"), "WARN": ("#d97706", "#fffbeb"),
+                 "CRIT": ("#ea580c", "#fff7ed"), "FAIL": ("#dc2626", "#fef2f2")}
+# Read through the checker's query API instead of local files, e.g. when the
+# dashboard runs on another machine; comma-separated for several workers
+CHECKER_API = [u.strip().rstrip("/") for u in os.environ.get("CHECKER_API", "").split(",") if u.strip()]
+STATE_COLUMNS = ["name","status","first_failed_at","last_changed_at","consecutive_failures","last_notification_at"]
+
+def storage_backend():
+    # Same selection as the checker: STORE_BACKEND env, else global.storage in checks.yaml
+    if os.environ.get("STORE_BACKEND"):
+        return os.environ["STORE_BACKEND"]
+    try:
+        cfg = yaml.safe_load(open(os.environ.get("CHECKS_PATH", "checks.yaml")))
+        return (cfg.get("global") or {}).get("storage") or "file"
+    except FileNotFoundError:
+        return "file"
+
+BACKEND = storage_backend()
+
+def _db():
+    # Read-only connection; WAL lets us read while the checker writes
+    return sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, timeout=5)
+
+def _api_get(base, path, **params):
+    r = requests.get(base + path, params=params, timeout=10)
+    r.raise_for_status()
+    return r.json()
 
 @st.cache_data(ttl=3)
 def load_states():
+    if CHECKER_API:
+        rows = []
+        for base in CHECKER_API:
+            try:
+                rows += _api_get(base, "/api/state")["states"]
+            except requests.RequestException:
+                continue
+        if not rows:
+            return pd.DataFrame(columns=STATE_COLUMNS)
+        # workers share the state file, so the same check can come back more than once
+        df = pd.DataFrame(rows).sort_values("last_changed_at", na_position="first")
+        return df.drop_duplicates("name", keep="last")
+    if BACKEND == "sqlite":
+        if not os.path.exists(DB_PATH):
+            return pd.DataFrame(columns=STATE_COLUMNS)
+        with _db() as con:
+            return pd.read_sql_query(f"SELECT {','.join(STATE_COLUMNS)} FROM checks_state", con)
     if not os.path.exists(STATE_PATH):
-        return pd.DataFrame(columns=["name","status","first_failed_at","last_changed_at","consecutive_failures","last_notification_at"])
+        return pd.DataFrame(columns=STATE_COLUMNS)
     data = json.load(open(STATE_PATH))
     rows = [{ "name": k, **v } for k,v in data.items()]
     return pd.DataFrame(rows)
 
+def _segment_start(path):
+    try:
+        return int(os.path.basename(path).split("-")[0])
+    except ValueError:
+        return -1
+
+def _segment_end(path):
+    try:
+        start, span = os.path.basename(path).split("-")[:2]
+        return int(start) + int(span.split(".")[0])
+    except ValueError:
+        return -1
+
+def _tail_lines(path, n, block=64 * 1024):
+    # Read backwards from EOF until we have n complete lines; returns (lines, end_offset)
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = pos = f.tell()
+        buf = b""
+        while pos > 0 and buf.count(b"\n") <= n:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+    complete = buf[:buf.rfind(b"\n") + 1]
+    end_offset = end - (len(buf) - len(complete))
+    lines = complete.splitlines()
+    if pos > 0:
+        lines = lines[1:]   # first line may be cut in half
+    return lines[-n:], end_offset
+
+class ResultsTail:
+    """Bounded in-memory view of the newest results, shared by all sessions.
+
+    Remembers the byte offset it last read in each current segment (one per
+    checker worker), so each refresh only parses bytes appended since; a cold
+    start reads backwards from EOF.
+    """
+
+    def __init__(self, directory, max_lines=2000):
+        self.dir = directory
+        self.records = deque(maxlen=max_lines)
+        self.offsets = {}   # segment path -> bytes read
+        self.newest = None  # start of the newest segment seen
+        self.lock = threading.Lock()
+
+    def _add(self, lines):
+        for line in lines:
+            if not line.strip(): continue
+            try:
+                self.records.append(json.loads(line))
+            except ValueError:
+                continue
+
+    def _cold_start(self, segments):
+        need = self.records.maxlen
+        recs = []
+        newest = _segment_start(segments[-1])
+        for path in reversed(segments):
+            if need <= 0 and _segment_start(path) != newest:
+                break
+            lines, end = _tail_lines(path, max(need, 1))
+            if _segment_start(path) == newest:
+                self.offsets[path] = end
+            if need > 0:
+                recs[:0] = lines[-need:]
+                need -= len(lines)
+        self.newest = newest
+        self._add(recs)
+        ordered = sorted(self.records, key=lambda r: r["ts"])   # workers' segments interleave
+        self.records.clear()
+        self.records.extend(ordered)
+
+    def _read_new(self, path, offset):
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]   # leave a half-written line for next time
+        self._add(complete.splitlines())
+        return offset + len(complete)
+
+    def refresh(self):
+        with self.lock:
+            segments = sorted(glob.glob(os.path.join(self.dir, "*.jsonl")), key=_segment_start)
+            if not segments:
+                return
+            if self.newest is None:
+                self._cold_start(segments)
+                return
+            for path in segments:
+                start = _segment_start(path)
+                if path in self.offsets:
+                    self.offsets[path] = self._read_new(path, self.offsets[path])
+                elif start >= self.newest:
+                    self.offsets[path] = self._read_new(path, 0)
+                    self.newest = start
+            # forget segments that were removed or are two or more segments old
+            self.offsets = {p: o for p, o in self.offsets.items()
+                            if os.path.exists(p) and _segment_end(p) >= self.newest}
+
+    def frame(self):
+        with self.lock:
+            return pd.DataFrame(list(self.records))
+
+class SqliteResultsTail:
+    """Same bounded window as ResultsTail, fed by rowid from the SQLite results table."""
+
+    def __init__(self, path, max_lines=2000):
+        self.path = path
+        self.records = deque(maxlen=max_lines)
+        self.last_rowid = None
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        with self.lock:
+            if not os.path.exists(self.path):
+                return
+            with _db() as con:
+                if self.last_rowid is None:
+                    rows = con.execute("SELECT rowid,ts,name,status,latency_ms,details_json FROM results "
+                                       "ORDER BY rowid DESC LIMIT ?", (self.records.maxlen,)).fetchall()[::-1]
+                else:
+                    rows = con.execute("SELECT rowid,ts,name,status,latency_ms,details_json FROM results "
+                                       "WHERE rowid>? ORDER BY rowid", (self.last_rowid,)).fetchall()
+            for rowid, ts, name, status, latency_ms, details in rows:
+                self.records.append({"ts": ts, "name": name, "status": status,
+                                     "latency_ms": latency_ms, "details": details})
+                self.last_rowid = rowid
+            if self.last_rowid is None:
+                self.last_rowid = 0
+
+    def frame(self):
+        with self.lock:
+            return pd.DataFrame(list(self.records))
+
+class ApiResultsTail:
+    """Same bounded window, fed from each checker's /api/results by cursor, so a
+    refresh only transfers results recorded since the last one."""
+
+    def __init__(self, bases, max_lines=2000):
+        self.bases = bases
+        self.records = deque(maxlen=max_lines)
+        self.cursors = {}   # base url -> (boot, cursor)
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        with self.lock:
+            added = 0
+            for base in self.bases:
+                try:
+                    if base in self.cursors:
+                        boot, cursor = self.cursors[base]
+                        data = _api_get(base, "/api/results", cursor=cursor, boot=boot, limit=self.records.maxlen)
+                    else:
+                        data = _api_get(base, "/api/results", limit=self.records.maxlen)
+                except requests.RequestException:
+                    continue
+                self.cursors[base] = (data["boot"], data["cursor"])
+                self.records.extend(data["results"])
+                added += len(data["results"])
+            if added and len(self.bases) > 1:
+                ordered = sorted(self.records, key=lambda r: r["ts"])
+                self.records.clear()
+                self.records.extend(ordered)
+
+    def frame(self):
+        with self.lock:
+            return pd.DataFrame([{k: v for k, v in r.items() if k != "seq"} for r in self.records])
+
+@st.cache_resource
+def results_tail():
+    if CHECKER_API:
+        return ApiResultsTail(CHECKER_API)
+    if BACKEND == "sqlite":
+        return SqliteResultsTail(DB_PATH)
+    return ResultsTail(RESULTS_DIR)
+
 @st.cache_data(ttl=3)
-def load_recent_results(max_lines=2000):
-    if not os.path.exists(RESULTS_PATH):
+def load_recent_results():
+    tail = results_tail()
+    tail.refresh()
+    df = tail.frame()
+    if df.empty:
         return pd.DataFrame(columns=["ts","name","status","latency_ms","details"])
-    lines = []
-    with open(RESULTS_PATH, "r") as f:
-        for i, line in enumerate(f):
-            if not line.strip(): continue
-            lines.append(json.loads(line))
-    lines = lines[-max_lines:]
-    return pd.DataFrame(lines)
+    return df
+
+@st.cache_data(ttl=30)
+def load_rollups(res, name):
+    # Pre-aggregated buckets written by the checker (checker/rollups.py)
+    since = time.time() - ROLLUP_WINDOWS[res]
+    if CHECKER_API:
+        for base in CHECKER_API:
+            try:
+                return pd.DataFrame(_api_get(base, "/api/history", res=res, name=name, since=since)["rows"])
+            except requests.RequestException:
+                continue
+        return pd.DataFrame()
+    if BACKEND == "sqlite":
+        if not os.path.exists(DB_PATH):
+            return pd.DataFrame()
+        with _db() as con:
+            return pd.read_sql_query("SELECT ts,n,availability,p50,p95,p99 FROM rollups "
+                                     "WHERE res=? AND name=? AND ts>=? ORDER BY ts", con, params=(res, name, since))
+    rows = {}
+    key = '"name": ' + json.dumps(name, ensure_ascii=False)   # as the checker writes it
+    for path in sorted(glob.glob(os.path.join(ROLLUPS_DIR, res, "*.jsonl")), key=_segment_start):
+        if _segment_start(path) + 86400 < since:
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if key not in line: continue
+                try:
+                    r = json.loads(line)
+                except ValueError:
+                    continue
+                if r["ts"] >= since:
+                    rows[r["ts"]] = merge_rows(rows[r["ts"]], r) if r["ts"] in rows else r
+    return pd.DataFrame(sorted(rows.values(), key=lambda r: r["ts"]))
 
 st.set_page_config(page_title="Morning Checks", layout="wide")
 st.title("Regular / Morning Checks – Live Dashboard")
@@ -37,9 +297,9 @@ with col1:
         st.info("No checks yet. Wait ~30s after starting the checker.")
     else:
         for _, row in states.sort_values("name").iterrows():
-            color = "#16a34a" if row.status=="OK" else "#dc2626"
+            color, bg = STATUS_COLORS.get(row.status, STATUS_COLORS["FAIL"])
             st.markdown(f"""
-<div style="border:1px solid #e5e7eb;border-radius:12px;padding:10px;margin-bottom:8px;background:{'#ecfdf5' if row.status=='OK' else '#fef2f2'}">
+<div style="border:1px solid #e5e7eb;border-radius:12px;padding:10px;margin-bottom:8px;background:{bg}">
 <b>{row['name']}</b><br>
 Status: <span style="color:{color};font-weight:bold">{row['status']}</span><br>
 Consecutive failures: {int(row.get('consecutive_failures') or 0)}
@@ -50,11 +310,29 @@ with col2:
     st.subheader("Last 24h Results")
     df = load_recent_results()
     if not df.empty:
-        
+        df = df[df["ts"] >= time.time() - 86400].copy()
+    if not df.empty:
+
         IST = pytz.timezone("Asia/Kolkata")
         df["time"] = pd.to_datetime(df["ts"], unit="s", utc=True).dt.tz_convert(IST)
         st.dataframe(df[["time","name","status","latency_ms","details"]], use_container_width=True, height=420)
     else:
         st.info("No results yet.")
 
+st.subheader("Availability & latency")
+if not states.empty:
+    c1, c2 = st.columns([2,1])
+    check = c1.selectbox("Check", sorted(states["name"]))
+    res = c2.radio("Resolution", list(ROLLUP_WINDOWS), index=1, horizontal=True)
+    roll = load_rollups(res, check)
+    if roll.empty:
+        st.info("No rollups yet; buckets appear once they close.")
+    else:
+        roll["time"] = pd.to_datetime(roll["ts"], unit="s", utc=True).dt.tz_convert(pytz.timezone("Asia/Kolkata"))
+        roll = roll.set_index("time")
+        if roll["n"].sum():
+            st.metric("Availability", f"{(roll['availability'] * roll['n']).sum() / roll['n'].sum():.3%}")
+        st.line_chart(roll[["p50","p95","p99"]], height=220)
+        st.area_chart(roll[["availability"]], height=160)
+
 st.caption("Tip: use MockApp /admin/faults to inject failures; /admin/reset to recover.")
@@ -1,9 +1,51 @@
 from fastapi import FastAPI, Body
 from fastapi.responses import HTMLResponse, JSONResponse
 from pydantic import BaseModel
-import time
+import asyncio, hashlib, json, time, uuid
+from .scale import router as scale_router
 
 app = FastAPI(title="MockApp + Control Panel")
+app.include_router(scale_router)   # /svc/{id}/health synthetic services (scale mode)
+
+# The demo health endpoints answer GET with an ETag (hash of the body), and a
+# request whose If-None-Match still matches gets an empty 304, like a caching
+# proxy would. Plain ASGI so every other route (scale mode's /svc/*, whose
+# bodies never repeat) passes straight through, unbuffered.
+ETAG_PATHS = {"/health", "/api/ping", "/db/health", "/queue/health", "/health/batch"}
+
+class ETagMiddleware:
+    def __init__(self, app, paths=ETAG_PATHS):
+        self.app, self.paths = app, frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        start, body = None, []
+
+        async def buffer(message):
+            nonlocal start
+            if message["type"] == "http.response.start" and message["status"] != 200:
+                start = False   # errors pass through untagged
+            if start is False:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            body.append(message.get("body", b""))
+            if message.get("more_body"):
+                return
+            data = b"".join(body)
+            tag = b'"' + hashlib.blake2b(data, digest_size=8).hexdigest().encode() + b'"'
+            if dict(scope["headers"]).get(b"if-none-match") == tag:
+                await send({"type": "http.response.start", "status": 304, "headers": [(b"etag", tag)]})
+                await send({"type": "http.response.body", "body": b""})
+                return
+            await send({**start, "headers": list(start["headers"]) + [(b"etag", tag)]})
+            await send({"type": "http.response.body", "body": data})
+
+        await self.app(scope, receive, buffer)
+
+app.add_middleware(ETagMiddleware)
 
 class Faults(BaseModel):
     api_down: bool = False
@@ -45,23 +87,64 @@ def queue_health():
         q["oldest_age_s"] = max(q["oldest_age_s"], 1200)
     return q
 
+# One round trip for several health endpoints: each part is answered with the
+# status code and body its own endpoint would return
+BATCH_PARTS = {"health": health, "api": api_ping, "db": db_health, "queue": queue_health}
+
+@app.get("/health/batch")
+def health_batch(include: str = ",".join(BATCH_PARTS)):
+    out = {}
+    for part in include.split(","):
+        fn = BATCH_PARTS.get(part.strip())
+        if fn is None:
+            out[part] = {"status_code": 404, "body": {"detail": f"unknown part, expected one of {list(BATCH_PARTS)}"}}
+            continue
+        r = fn()
+        if isinstance(r, JSONResponse):
+            out[part] = {"status_code": r.status_code, "body": json.loads(r.body)}
+        else:
+            out[part] = {"status_code": 200, "body": r}
+    return out
+
+JOB_DURATION_S = 20
+JOB_WAIT_MAX_S = 60
+FINAL = ("succeeded", "failed")
+
+def _job_state(job):
+    # jobs finish lazily: the first look after duration_s settles the outcome
+    if job["status"] == "running" and time.time() - job["start"] > job["expected_s"]:
+        job["status"] = "failed" if STATE["faults"]["job_fail"] else "succeeded"
+        job["finished_at"] = time.time()
+    return job
+
 @app.post("/jobs/run")
-def run_job():
-    job_id = f"job_{int(time.time())}"
-    STATE["jobs"][job_id] = {"status": "running", "start": time.time()}
-    # also save to a helper file so the checker can discover the latest job id
-    open(".last_job_id", "w").write(job_id)
-    return {"job_id": job_id}
+def run_job(duration_s: float = JOB_DURATION_S):
+    # unique even when several jobs start in the same second
+    job_id = f"job_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+    STATE["jobs"][job_id] = {"status": "running", "start": time.time(), "expected_s": duration_s}
+    return {"job_id": job_id, "expected_s": duration_s}
+
+@app.get("/jobs")
+def list_jobs(limit: int = 20):
+    recent = list(STATE["jobs"].items())[-limit:]
+    return {"jobs": [{"job_id": k, **_job_state(v)} for k, v in recent]}
 
 @app.get("/jobs/{job_id}/status")
 def job_status(job_id: str):
     job = STATE["jobs"].get(job_id)
     if not job:
         return {"status": "unknown"}
-    # simulate finish after 20s
-    elapsed = time.time() - job["start"]
-    if elapsed > 20 and job["status"] == "running":
-        job["status"] = "failed" if STATE["faults"]["job_fail"] else "succeeded"
+    return {"status": _job_state(job)["status"]}
+
+@app.get("/jobs/{job_id}/wait")
+async def job_wait(job_id: str, timeout: float = 25):
+    # long-poll: answers as soon as the job finishes, or with its current status after `timeout`
+    job = STATE["jobs"].get(job_id)
+    if not job:
+        return {"status": "unknown"}
+    end = time.time() + min(timeout, JOB_WAIT_MAX_S)
+    while _job_state(job)["status"] not in FINAL and time.time() < end:
+        await asyncio.sleep(min(0.25, max(0.0, end - time.time())))
     return {"status": job["status"]}
 
 # ---- Admin API (used by the Control Panel & the checker auto-actions) ----
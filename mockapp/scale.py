@@ -0,0 +1,199 @@
+import asyncio, json, math, os, random, time
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Body, HTTPException
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+try:
+    import fcntl
+except ImportError:   # Windows: no cross-worker locking
+    fcntl = None
+
+# Scale mode: MOCK_SERVICES synthetic services at /svc/{id}/health, each with its
+# own latency distribution, error rate and body size. Specs are derived from
+# MOCK_SEED, so every uvicorn worker serves identical services without sharing
+# memory; injected faults live in a small JSON file that all workers watch.
+
+SERVICES = int(os.getenv("MOCK_SERVICES", "1000"))
+GROUPS = int(os.getenv("MOCK_GROUPS", "10"))
+SEED = int(os.getenv("MOCK_SEED", "42"))
+FAULTS_PATH = os.getenv("MOCK_FAULTS_PATH", "./.mock_faults.json")
+FAULTS_POLL_S = 0.25
+
+router = APIRouter()
+
+def service_spec(i):
+    rnd = random.Random(SEED * 1_000_003 + i)
+    kind = rnd.choices(["fixed", "normal", "longtail"], weights=[3, 5, 2])[0]
+    spec = {"id": i, "group": f"g{i % GROUPS}", "latency": kind,
+            "error_rate": rnd.choice([0.0] * 8 + [0.001, 0.01]),
+            "body_bytes": rnd.choice([64, 256, 1024, 4096, 32768])}
+    if kind == "fixed":
+        spec["ms"] = rnd.choice([1, 2, 5, 10, 20])
+    elif kind == "normal":
+        spec["mean_ms"] = rnd.uniform(5, 50)
+        spec["sd_ms"] = spec["mean_ms"] / 4
+    else:
+        # lognormal: median `median_ms`, p99 about 10x the median
+        spec["median_ms"] = rnd.uniform(5, 30)
+        spec["sigma"] = 1.0
+    return spec
+
+_specs: Dict[int, dict] = {}
+
+def spec_for(i):
+    if not 0 <= i < SERVICES:
+        return None
+    s = _specs.get(i)
+    if s is None:
+        s = _specs[i] = service_spec(i)
+    return s
+
+def sample_latency_ms(spec, rnd=random):
+    kind = spec["latency"]
+    if kind == "fixed":
+        return spec["ms"]
+    if kind == "normal":
+        return max(0.0, rnd.gauss(spec["mean_ms"], spec["sd_ms"]))
+    return spec["median_ms"] * math.exp(rnd.gauss(0, spec["sigma"]))
+
+# ---- faults shared across workers ----
+class SvcFault(BaseModel):
+    down: bool = False                 # respond 503
+    error_rate: Optional[float] = None # replaces the service's error rate
+    latency_add_ms: float = 0
+    latency_mult: float = 1
+    body_bytes: Optional[int] = None
+
+class FaultRequest(BaseModel):
+    services: List[int] = []
+    group: Optional[str] = None
+    all: bool = False
+    fault: SvcFault = SvcFault()
+
+_faults = {"all": {}, "groups": {}, "services": {}}
+_faults_stamp = None
+_faults_checked = 0.0
+
+def _load_faults():
+    global _faults, _faults_stamp, _faults_checked
+    now = time.monotonic()
+    if now - _faults_checked < FAULTS_POLL_S:
+        return _faults
+    _faults_checked = now
+    try:
+        st = os.stat(FAULTS_PATH)
+    except FileNotFoundError:
+        _faults, _faults_stamp = {"all": {}, "groups": {}, "services": {}}, None
+        return _faults
+    stamp = (st.st_mtime_ns, st.st_size)
+    if stamp != _faults_stamp:
+        try:
+            with open(FAULTS_PATH) as f:
+                _faults = json.load(f)
+            _faults_stamp = stamp
+        except ValueError:
+            pass   # mid-write; next poll
+    return _faults
+
+def _update_faults(fn):
+    # read-modify-write under an exclusive lock, then atomic replace
+    with open(FAULTS_PATH + ".lock", "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(FAULTS_PATH) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            data = {"all": {}, "groups": {}, "services": {}}
+        fn(data)
+        tmp = f"{FAULTS_PATH}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, FAULTS_PATH)
+    global _faults_checked
+    _faults_checked = 0.0   # this worker sees it on the next request
+    return data
+
+def fault_for(spec):
+    f = _load_faults()
+    merged = dict(f.get("all") or {})
+    merged.update(f.get("groups", {}).get(spec["group"]) or {})
+    merged.update(f.get("services", {}).get(str(spec["id"])) or {})
+    return merged
+
+# ---- endpoints ----
+_pads: Dict[int, str] = {}
+
+def _body(i, latency_ms, size):
+    pad = _pads.get(size)
+    if pad is None:
+        pad = _pads[size] = "x" * size
+    head = f'{{"ok": true, "id": {i}, "latency_ms": {latency_ms:.1f}, "pad": "'
+    return (head + pad[:max(0, size - len(head) - 2)] + '"}').encode()
+
+@router.get("/svc/{i}/health")
+async def svc_health(i: int):
+    return await _probe(i)
+
+async def _probe(i):
+    spec = spec_for(i)
+    if spec is None:
+        raise HTTPException(404, f"no service {i} (MOCK_SERVICES={SERVICES})")
+    fault = fault_for(spec)
+    latency = sample_latency_ms(spec) * fault.get("latency_mult", 1) + fault.get("latency_add_ms", 0)
+    if latency > 0:
+        await asyncio.sleep(latency / 1000)
+    if fault.get("down"):
+        return Response(b'{"ok": false, "detail": "injected outage"}', status_code=503,
+                        media_type="application/json")
+    err = fault.get("error_rate")
+    if random.random() < (spec["error_rate"] if err is None else err):
+        return Response(b'{"ok": false, "detail": "injected error"}', status_code=500,
+                        media_type="application/json")
+    return Response(_body(i, latency, fault.get("body_bytes") or spec["body_bytes"]),
+                    media_type="application/json")
+
+@router.get("/svc/batch")
+async def svc_batch(ids: str):
+    # health of several services in one round trip, probed concurrently: "1,2,3" or "0-99"
+    want = []
+    for part in ids.split(","):
+        lo, _, hi = part.partition("-")
+        want += range(int(lo), int(hi or lo) + 1)
+    if len(want) > 1000:
+        raise HTTPException(400, "at most 1000 services per batch")
+    unknown = [i for i in want if spec_for(i) is None]
+    if unknown:
+        raise HTTPException(404, f"no service(s) {unknown[:10]} (MOCK_SERVICES={SERVICES})")
+    resps = await asyncio.gather(*(_probe(i) for i in want))
+    return {str(i): {"status_code": r.status_code, "body": json.loads(r.body)} for i, r in zip(want, resps)}
+
+@router.get("/admin/svc")
+def svc_overview():
+    global _faults_checked
+    _faults_checked = 0.0
+    return {"services": SERVICES, "groups": GROUPS, "seed": SEED, "faults": _load_faults()}
+
+@router.get("/admin/svc/{i}")
+def svc_detail(i: int):
+    spec = spec_for(i)
+    if spec is None:
+        raise HTTPException(404, f"no service {i}")
+    return {"spec": spec, "fault": fault_for(spec)}
+
+@router.post("/admin/svc/faults")
+def svc_set_faults(req: FaultRequest = Body(...)):
+    fault = req.fault.model_dump(exclude_defaults=True)
+    def apply(d):
+        if req.all:
+            d["all"] = fault
+        if req.group is not None:
+            d["groups"][req.group] = fault
+        for i in req.services:
+            d["services"][str(i)] = fault
+    return {"ok": True, "faults": _update_faults(apply)}
+
+@router.post("/admin/svc/reset")
+def svc_reset():
+    return {"ok": True, "faults": _update_faults(lambda d: d.update({"all": {}, "groups": {}, "services": {}}))}